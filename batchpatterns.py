@@ -0,0 +1,127 @@
+import random
+
+import numpy as np
+
+# Block patterns many at a time: a batch is a bool array of shape
+# (n, size, size), True for a block, and every check below runs over the
+# whole batch at once. Patterns are symmetric under a half turn, as
+# patterns.build_pattern and the scripts make them.
+
+
+def random_batch(size, n, lo, hi):
+    # n patterns, each with its block probability drawn from [lo, hi); the
+    # numpy generator is seeded from random, so random.seed still fixes them
+    rng = np.random.default_rng(random.getrandbits(64))
+    p = rng.uniform(lo, hi, n)
+    blocks = rng.random((n, size, size)) < p[:, None, None]
+    r, c = np.indices((size, size))
+    upper = r * size + c <= (size - 1 - r) * size + (size - 1 - c)
+    return np.where(upper, blocks, blocks[:, ::-1, ::-1])
+
+
+def run_lengths(blocks):
+    # (across, down): the length of the run through each white cell, 0 on blocks
+    white = ~blocks
+
+    def along_rows(w):
+        size = w.shape[2]
+        left = np.zeros(w.shape, np.int16)
+        right = np.zeros(w.shape, np.int16)
+        left[:, :, 0] = w[:, :, 0]
+        right[:, :, -1] = w[:, :, -1]
+        for c in range(1, size):
+            left[:, :, c] = (left[:, :, c - 1] + 1) * w[:, :, c]
+            right[:, :, size - 1 - c] = (right[:, :, size - c] + 1) * w[:, :, size - 1 - c]
+        return np.where(w, left + right - 1, 0)
+
+    return along_rows(white), along_rows(white.transpose(0, 2, 1)).transpose(0, 2, 1)
+
+
+def repair_runs(blocks, min_run=3):
+    # block every white cell on a run shorter than min_run, again until none
+    # is left; the run lengths are as symmetric as the blocks, so the
+    # patterns stay symmetric
+    while True:
+        across, down = run_lengths(blocks)
+        short = ~blocks & ((across < min_run) | (down < min_run))
+        if not short.any():
+            return blocks
+        blocks = blocks | short
+
+
+def component_labels(blocks):
+    # each white cell labelled with the lowest cell number in its connected
+    # region, -1 on blocks. Each round sweeps the lowest label along every
+    # run, forwards and back, across and then down, so a round carries it
+    # round a corner rather than one cell; rounds repeat until none changes
+    n, size, _ = blocks.shape
+    big = size * size
+    white = ~blocks
+    labels = np.where(blocks, big, np.arange(big).reshape(size, size)[None])
+    while True:
+        before = labels.copy()
+        for grid, w in ((labels, white), (labels.transpose(0, 2, 1), white.transpose(0, 2, 1))):
+            for c in range(1, size):
+                np.minimum(grid[:, :, c], grid[:, :, c - 1], out=grid[:, :, c], where=w[:, :, c])
+            for c in range(size - 2, -1, -1):
+                np.minimum(grid[:, :, c], grid[:, :, c + 1], out=grid[:, :, c], where=w[:, :, c])
+        if np.array_equal(before, labels):
+            break
+    return np.where(blocks, -1, labels)
+
+
+def slot_histograms(blocks, min_run=3):
+    # (n, size + 1) counts of the slots of each length, across and down
+    n, size, _ = blocks.shape
+    across, down = run_lengths(blocks)
+    white = ~blocks
+    starts_a = white.copy()
+    starts_a[:, :, 1:] &= blocks[:, :, :-1]
+    starts_d = white.copy()
+    starts_d[:, 1:, :] &= blocks[:, :-1, :]
+    hist = np.zeros((n, size + 1), np.int32)
+    for starts, runs in ((starts_a, across), (starts_d, down)):
+        idx, _, _ = np.nonzero(starts)
+        lengths = runs[starts]
+        keep = lengths >= min_run
+        np.add.at(hist, (idx[keep], lengths[keep]), 1)
+    return hist
+
+
+def survivors(blocks, min_white, max_white, min_slots, max_slots, min_run=3, lengths=()):
+    # which patterns of the batch pass the scripts' valid_pattern checks:
+    # white count, every run at least min_run long, connected whites, slot
+    # count, and a slot for each of lengths (counted with repeats). The
+    # dearer checks only look at the patterns left by the cheaper ones
+    n, size, _ = blocks.shape
+    if any(L > size for L in lengths):
+        return np.zeros(n, bool)
+    white = ~blocks
+    whites = white.sum(axis=(1, 2))
+    ok = (whites >= min_white) & (whites <= max_white)
+    across, down = run_lengths(blocks)
+    ok &= ~(white & ((across < min_run) | (down < min_run))).any(axis=(1, 2))
+    left = np.flatnonzero(ok)
+    hist = slot_histograms(blocks[left], min_run)
+    slots = hist.sum(axis=1)
+    need = np.bincount(np.asarray(lengths, np.int64), minlength=size + 1)
+    keep = (slots >= min_slots) & (slots <= max_slots) & (hist >= need).all(axis=1)
+    left = left[keep]
+    labels = component_labels(blocks[left])
+    first = labels.max(axis=(1, 2))
+    keep = ((labels == first[:, None, None]) | blocks[left]).all(axis=(1, 2)) & (first >= 0)
+    ok[:] = False
+    ok[left[keep]] = True
+    return ok
+
+
+def sample_patterns(size, n, lo, hi, min_white, max_white, min_slots, max_slots,
+                    min_run=3, lengths=()):
+    # the patterns among n random ones that survive once their short runs
+    # are blocked, as lists of rows of bools. Hardly any raw random pattern
+    # is free of short runs, and the repair blocks more of the grid, so lo
+    # and hi want to be about half the densities the scripts ask
+    # build_pattern for
+    blocks = repair_runs(random_batch(size, n, lo, hi), min_run)
+    ok = survivors(blocks, min_white, max_white, min_slots, max_slots, min_run, lengths)
+    return [b.tolist() for b in blocks[ok]]
@@ -0,0 +1,788 @@
+import heapq
+import math
+import random
+import time
+from collections import OrderedDict, defaultdict, deque
+
+
+def bitmask(ids, n):
+    buf = bytearray((n + 7) // 8)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def bits(mask):
+    # indexes of the set bits, lowest first
+    s = bin(mask)[:1:-1]
+    i = s.find('1')
+    while i >= 0:
+        yield i
+        i = s.find('1', i + 1)
+
+
+def build_indexes(words_by_len):
+    # one bitmask of word ids per (length, position, letter)
+    idx = {}
+    for L, ws in words_by_len.items():
+        pos = [defaultdict(list) for _ in range(L)]
+        for i, w in enumerate(ws):
+            for p, ch in enumerate(w):
+                pos[p][ch].append(i)
+        n = len(ws)
+        idx[L] = (ws, [{ch: bitmask(ids, n) for ch, ids in d.items()} for d in pos])
+    return idx
+
+
+def build_crossings(slots):
+    cell_to_slots = defaultdict(list)
+    for s in slots:
+        for idx, cell in enumerate(s.cells):
+            cell_to_slots[cell].append((s.sid, idx))
+    cross = defaultdict(list)
+    for cell, refs in cell_to_slots.items():
+        if len(refs) == 2:
+            (s1, i1), (s2, i2) = refs
+            cross[s1].append((i1, s2, i2))
+            cross[s2].append((i2, s1, i1))
+    return cross
+
+
+class NogoodStore:
+    # bounded LRU of (slot, word) combinations proven to have no fill, kept
+    # per slot layout so later solves of the same pattern can reuse them
+    def __init__(self, capacity=50000, max_size=8):
+        self.capacity = capacity
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.watch = defaultdict(list)
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, layout, pairs):
+        if len(pairs) > self.max_size:
+            return
+        key = (layout, pairs)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        self.entries[key] = None
+        for sid, w in pairs:
+            self.watch[layout, sid, w].append(pairs)
+        while len(self.entries) > self.capacity:
+            (old_layout, old), _ = self.entries.popitem(last=False)
+            for sid, w in old:
+                watched = self.watch[old_layout, sid, w]
+                watched.remove(old)
+                if not watched:
+                    del self.watch[old_layout, sid, w]
+
+    def dead(self, layout):
+        return (layout, frozenset()) in self.entries
+
+    def check(self, layout, sid, w, assignments):
+        # a stored nogood that placing w in sid would complete, if any
+        for pairs in self.watch.get((layout, sid, w), ()):
+            if all(x == sid or assignments.get(x) == v for x, v in pairs):
+                self.hits += 1
+                self.entries.move_to_end((layout, pairs))
+                return pairs
+        return None
+
+
+def penalty_groups(ws, penalty):
+    # the ids of ws grouped by penalty(word), as (penalty, mask), cheapest first
+    by = defaultdict(list)
+    for i, w in enumerate(ws):
+        by[penalty(w)].append(i)
+    return [(p, bitmask(ids, len(ws))) for p, ids in sorted(by.items())]
+
+
+class PenaltyTable:
+    # the words of each length of an index grouped by penalty(word), as
+    # (penalty, mask) with the cheapest group first, so the least a domain
+    # can still cost is one AND per group. Shareable between searches.
+    # With a key, a wordlist.LazyIndex keeps the groups on disk beside its
+    # compiled words, under that key: give one only for a penalty whose
+    # key changes whenever it does, as nothing else tells stale groups apart
+    def __init__(self, index, penalty, key=None):
+        self.index = index
+        self.penalty = penalty
+        self.key = key
+        self.groups = {}
+        self.memo = {}
+
+    def __getstate__(self):
+        # a copy sent to a worker rebuilds its groups there, from the index
+        return dict(self.__dict__, groups={}, memo={})
+
+    def of(self, w):
+        p = self.memo.get(w)
+        if p is None:
+            p = self.memo[w] = self.penalty(w)
+        return p
+
+    def classes(self, L):
+        groups = self.groups.get(L)
+        if groups is None:
+            if self.key is not None and hasattr(self.index, 'penalty_groups'):
+                groups = self.index.penalty_groups(L, self.penalty, self.key)
+            else:
+                groups = penalty_groups(self.index[L][0] if L in self.index else [], self.penalty)
+            self.groups[L] = groups
+        return groups
+
+    def least(self, L, mask):
+        for p, m in self.classes(L):
+            if mask & m:
+                return p
+        return 0
+
+
+class PatternCache:
+    # (length, pattern such as 'B?I??') -> bitmask of matching word ids in
+    # index, LRU-evicted to stay under max_bytes; not tied to any slot, so
+    # one cache serves every slot and every attempt on the same index.
+    # It lives in memory only: a lookup is a few ANDs of positional masks,
+    # cheaper than any read from disk, and what is dear to redo between
+    # runs, filtering and indexing the word list and grouping it by
+    # penalty, is kept in the files of wordlist.LazyIndex
+    def __init__(self, index, max_bytes=32 << 20):
+        self.index = index
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, L, pattern):
+        key = (L, pattern)
+        mask = self.entries.get(key)
+        if mask is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return mask
+        self.misses += 1
+        mask = pattern_mask(self.index, L, pattern)
+        self.entries[key] = mask
+        self.bytes += self.entry_bytes(key, mask)
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            old, old_mask = self.entries.popitem(last=False)
+            self.bytes -= self.entry_bytes(old, old_mask)
+        return mask
+
+    def entry_bytes(self, key, mask):
+        return 100 + len(key[1]) + mask.bit_length() // 8
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries),
+                'bytes': self.bytes}
+
+
+def pattern_mask(index, L, pattern):
+    # bitmask of the words of length L matching pattern, '?' being a blank
+    if L not in index:
+        return 0
+    ws, pos = index[L]
+    mask = (1 << len(ws)) - 1
+    for i, ch in enumerate(pattern):
+        if ch != '?':
+            mask &= pos[i].get(ch, 0)
+            if not mask:
+                break
+    return mask
+
+
+def luby(i):
+    # 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ... for i = 1, 2, 3, ...
+    while True:
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+
+
+def restart_limits(schedule, base):
+    run = 0
+    while True:
+        run += 1
+        if schedule == 'luby':
+            yield base * luby(run)
+        else:
+            yield int(base * 1.5 ** (run - 1))
+
+
+def layout_key(slots):
+    return tuple((s.sid, s.direction, s.cells[0], s.length) for s in slots)
+
+
+class Layout:
+    # flat, precomputed tables for one slot pattern, shareable between
+    # searches: cells as offsets into a width*height grid, and the crossings
+    # both as per-slot (i, other, j) tuples and as AC-3 arcs with ids
+    def __init__(self, slots):
+        self.n = max((s.sid for s in slots), default=-1) + 1
+        self.width = max((c for s in slots for _, c in s.cells), default=-1) + 1
+        self.height = max((r for s in slots for r, _ in s.cells), default=-1) + 1
+        self.key = layout_key(slots)
+        self.sids = tuple(s.sid for s in slots)
+        self.lengths = [0] * self.n
+        self.cells = [()] * self.n
+        for s in slots:
+            self.lengths[s.sid] = s.length
+            self.cells[s.sid] = tuple(r * self.width + c for r, c in s.cells)
+        cross = build_crossings(slots)
+        self.cross = [tuple(cross.get(sid, ())) for sid in range(self.n)]
+        self.arcs = []
+        out = [[] for _ in range(self.n)]
+        for sid in range(self.n):
+            for i, other, j in self.cross[sid]:
+                arc = (len(self.arcs), sid, i, other, j)
+                self.arcs.append(arc)
+                out[sid].append(arc)
+        self.out_arcs = [tuple(a) for a in out]
+
+
+class Frame:
+    # one open node of the search: the slot, its ordered candidates, the
+    # next one to try, and trail marks for undoing the current one
+    __slots__ = ('sid', 'cands', 'pos', 'conflict', 'word', 'mark', 'cell_mark')
+
+    def __init__(self, sid, cands, conflict):
+        self.sid = sid
+        self.cands = cands
+        self.pos = 0
+        self.conflict = conflict
+        self.word = None
+        self.mark = 0
+        self.cell_mark = 0
+
+
+class FillSearch:
+    # the fill backtracker on an explicit stack. step(n) advances it by up to
+    # n search nodes and returns; calling it again resumes where it stopped.
+    #
+    # order: 'score' (word id order, which is best-scoring first for a
+    #   wordlist index), 'lcv' (least constraining first: the words leaving
+    #   the most options in the slots they cross, ties in id order) or
+    #   'random'
+    # propagate: None, 'fc' (forward checking) or 'ac3'
+    # backjump: conflict-directed backjumping instead of chronological
+    # nogoods: a NogoodStore to learn into and prune with
+    # restarts: None, 'luby' or 'geometric' node limits per run, in units of
+    #   restart_base; each restart reshuffles the value ordering
+    # cache: a PatternCache on index for the starting domains, or anything
+    #   else with get(L, pattern) -> mask
+    # tiers: increasing word counts; every slot starts on the first tiers[0]
+    #   words of its length (the best-ranked ones) and moves to the next
+    #   tier, then the whole list, only once the search keeps failing on it
+    # limit: the most candidates tried per node, or None for all of them
+    # penalties, bound: with a PenaltyTable, prune every branch whose placed
+    #   penalty plus the least each open domain can add reaches bound, the
+    #   total of the best fill found so far
+    # exclude: words no slot may take, beyond the forced ones; conflicts they
+    #   cause are not learned, since they do not hold without them
+    # slots may also be a prebuilt Layout, shared by several searches
+    def __init__(self, slots, forced, index, order='score', limit=350, propagate='ac3',
+                 backjump=False, nogoods=None, restarts=None, restart_base=200, cache=None,
+                 tiers=(), penalties=None, bound=None, exclude=()):
+        lay = slots if isinstance(slots, Layout) else Layout(slots)
+        self.lay = lay
+        self.index = index
+        self.order = order
+        self.limit = limit
+        self.propagate = propagate
+        self.backjump = backjump
+        self.nogoods = nogoods
+        self.cache = cache
+        self.tiers = tuple(tiers)
+        self.tier = [0] * lay.n
+        self.restricted = bytearray(lay.n)
+        self.failures = [0] * lay.n
+        self.penalties = penalties
+        self.bound = bound if penalties is not None else None
+
+        self.status = None  # None while running, then 'filled' or 'failed'
+        self.nodes = 0
+        self.run = 0
+        self.runs = [0]
+        self.limits = restart_limits(restarts, restart_base) if restarts else None
+        self.run_limit = next(self.limits) if self.limits else float('inf')
+        self.stack = []
+        self.descend = True
+
+        # the grid is one byte per cell, 0 while empty; cell_trail holds the
+        # offsets written by placements, in order, for undo
+        self.flat = bytearray(lay.width * lay.height)
+        self.cell_trail = []
+        self.placed = bytearray(lay.n)
+        self.assignments = dict(forced)
+        self.used_words = set(self.assignments.values()) | set(exclude)
+        self.word_slot = {w: sid for sid, w in self.assignments.items()}
+        for sid, w in self.assignments.items():
+            self.placed[sid] = 1
+            for off, ch in zip(lay.cells[sid], w.encode()):
+                if self.flat[off] and self.flat[off] != ch:
+                    self.status = 'failed'
+                self.flat[off] = ch
+        self.unfilled = [sid for sid in lay.sids if not self.placed[sid]]
+        self.spent = 0
+        if self.bound is not None:
+            self.spent = sum(penalties.of(w) for w in self.assignments.values())
+        if nogoods is not None and nogoods.dead(lay.key):
+            self.status = 'failed'
+
+        # flags a conflict set that rests on a truncated candidate list or a
+        # tier-restricted domain, so it proves nothing and must not be learned
+        self.partial = 1 << lay.n
+        # flags one that rests on bound pruning: final for this bound, since
+        # no fill here can beat it, but not a nogood either
+        self.pruned = 1 << (lay.n + 1)
+        self.queue = deque()
+        self.queued = bytearray(len(lay.arcs))
+        self.init_domains()
+
+    def init_domains(self):
+        # live domain of every unfilled slot, narrowed as crossings get
+        # filled. reasons[sid] is a bitmask of the slots whose placements did
+        # the narrowing; (sid, old mask, old reason) triples go on the trail
+        # so a backtrack can restore both. Only called with nothing placed
+        # beyond the forced entries
+        lay = self.lay
+        self.domains = [0] * lay.n
+        self.reasons = [0] * lay.n
+        self.counts = [0] * lay.n
+        self.restricted = bytearray(lay.n)
+        for sid in self.unfilled:
+            m = self.pattern_mask(sid)
+            cut = self.tier_mask(sid)
+            if m & ~cut:
+                m &= cut
+                self.restricted[sid] = 1
+                self.reasons[sid] = self.partial
+            self.domains[sid] = m
+            self.counts[sid] = m.bit_count()
+            for _, other, _ in lay.cross[sid]:
+                if self.placed[other]:
+                    self.reasons[sid] |= 1 << other
+        self.heap = [(self.counts[sid], sid) for sid in self.unfilled]
+        heapq.heapify(self.heap)
+        self.trail = []
+
+        if self.status is None and self.propagate == 'ac3':
+            for sid in self.unfilled:
+                self.enqueue(sid, -1)
+            res = self.ac3()
+            if res is not None:
+                if res & self.partial and self.widen(True):
+                    self.init_domains()
+                    return
+                self.learn(res)
+                self.status = 'failed'
+
+    def tier_mask(self, sid):
+        t = self.tier[sid]
+        if t >= len(self.tiers):
+            return -1
+        return (1 << self.tiers[t]) - 1
+
+    def widen(self, exhausted=False):
+        # move restricted slots the search failed on to their next tier: the
+        # ones with at least half the most failures, or, once a run has
+        # exhausted everything, all that failed at all (every restricted slot
+        # if none did). True if any slot widened
+        fails = self.failures
+        held = [sid for sid in self.lay.sids if self.restricted[sid]]
+        if exhausted:
+            pick = [sid for sid in held if fails[sid]] or held
+        else:
+            top = max((fails[sid] for sid in held), default=0)
+            pick = [sid for sid in held if top and 2 * fails[sid] >= top]
+        for sid in pick:
+            self.tier[sid] += 1
+        self.failures = [0] * self.lay.n
+        return bool(pick)
+
+    @property
+    def depth(self):
+        return len(self.stack)
+
+    def grid(self):
+        # the partial fill as {(r, c): letter}
+        w = self.lay.width
+        return {divmod(off, w): chr(ch) for off, ch in enumerate(self.flat) if ch}
+
+    def pattern(self, sid):
+        flat = self.flat
+        return bytes(flat[off] or 63 for off in self.lay.cells[sid]).decode()
+
+    def pattern_mask(self, sid):
+        L = self.lay.lengths[sid]
+        if self.cache is not None:
+            return self.cache.get(L, self.pattern(sid))
+        return pattern_mask(self.index, L, self.pattern(sid))
+
+    def narrow(self, sid, mask, why):
+        self.trail.append((sid, self.domains[sid], self.reasons[sid]))
+        self.domains[sid] = mask
+        self.reasons[sid] = why
+        self.counts[sid] = n = mask.bit_count()
+        heapq.heappush(self.heap, (n, sid))
+        if not n:
+            self.failures[sid] += 1
+
+    def undo(self, mark):
+        trail = self.trail
+        while len(trail) > mark:
+            sid, mask, why = trail.pop()
+            self.domains[sid] = mask
+            self.reasons[sid] = why
+            self.counts[sid] = n = mask.bit_count()
+            heapq.heappush(self.heap, (n, sid))
+
+    def candidates(self, sid):
+        # the ordered words to try, plus the part of the conflict set that
+        # comes from domain words already placed elsewhere or cut by limit
+        mask = self.domains[sid]
+        if not mask:
+            return [], 0
+        ws = self.index[self.lay.lengths[sid]][0]
+        out = []
+        why = 0
+        for wi in bits(mask):
+            w = ws[wi]
+            if w in self.used_words:
+                slot = self.word_slot.get(w)
+                why |= self.partial if slot is None else 1 << slot
+            else:
+                out.append(w)
+        if self.order == 'random':
+            random.shuffle(out)
+        elif self.order == 'lcv':
+            self.lcv_sort(sid, out)
+        if self.order != 'random' and self.run:
+            # after a restart, vary the order only among near neighbours in
+            # rank so the run stays mostly best-first
+            for k in range(0, len(out), 8):
+                chunk = out[k:k + 8]
+                random.shuffle(chunk)
+                out[k:k + 8] = chunk
+        if self.limit is not None and len(out) > self.limit:
+            why |= self.partial
+            out = out[:self.limit]
+        return out, why
+
+    def lcv_sort(self, sid, words):
+        # rank by the log of the product of the supports each word leaves in
+        # its open crossings. The supports are counted once per crossing
+        # and letter, not per word, so a word only costs table lookups; a
+        # letter with no support scores as a wipeout
+        lay = self.lay
+        tables = []
+        for i, other, j in lay.cross[sid]:
+            if self.placed[other]:
+                continue
+            dom = self.domains[other]
+            t = {}
+            for ch, m in self.index[lay.lengths[other]][1][j].items():
+                n = (dom & m).bit_count()
+                if n:
+                    t[ch] = math.log(n)
+            tables.append((i, t))
+        if not tables or len(words) < 2:
+            return
+        dead = -1e9
+        words.sort(key=lambda w: -sum(t.get(w[i], dead) for i, t in tables))
+
+    def release(self, sid):
+        # back to unfilled; its heap entries were dropped while it was placed
+        self.placed[sid] = 0
+        self.unfilled.append(sid)
+        heapq.heappush(self.heap, (self.counts[sid], sid))
+
+    def choose_slot(self):
+        # MRV from the heap; entries whose count went stale are dropped
+        heap = self.heap
+        if len(heap) > 4 * len(self.unfilled) + 64:
+            heap[:] = [(self.counts[sid], sid) for sid in self.unfilled]
+            heapq.heapify(heap)
+        while heap:
+            n, sid = heap[0]
+            if self.placed[sid] or self.counts[sid] != n:
+                heapq.heappop(heap)
+                continue
+            return sid
+        return None
+
+    def enqueue(self, sid, skip):
+        # queue the arcs out of sid towards unfilled slots other than skip
+        queued = self.queued
+        for arc in self.lay.out_arcs[sid]:
+            b = arc[3]
+            if b != skip and not self.placed[b] and not queued[arc[0]]:
+                queued[arc[0]] = 1
+                self.queue.append(arc)
+
+    def revise(self, a, i, b, j):
+        # keep the words of b whose letter j can still sit at position i of a
+        lengths = self.lay.lengths
+        pos_a = self.index[lengths[a]][1][i]
+        pos_b = self.index[lengths[b]][1][j]
+        dom_a = self.domains[a]
+        support = 0
+        for ch, m in pos_a.items():
+            if dom_a & m:
+                support |= pos_b.get(ch, 0)
+        return self.domains[b] & support
+
+    def propagate_from(self, sid, w):
+        # narrow the slots crossing a fresh placement; on a wipeout return
+        # the conflict set of the emptied slot, otherwise None
+        bit = 1 << sid
+        lengths = self.lay.lengths
+        for i, other, j in self.lay.cross[sid]:
+            if self.placed[other]:
+                continue
+            dom = self.domains[other]
+            mask = dom & self.index[lengths[other]][1][j].get(w[i], 0)
+            if mask == dom:
+                continue
+            self.narrow(other, mask, self.reasons[other] | bit)
+            if not mask and self.propagate:
+                self.clear_queue()
+                return self.reasons[other]
+            if self.propagate == 'ac3':
+                self.enqueue(other, -1)
+        return self.ac3()
+
+    def ac3(self):
+        queue = self.queue
+        queued = self.queued
+        while queue:
+            aid, a, i, b, j = queue.popleft()
+            queued[aid] = 0
+            if self.placed[b]:
+                continue
+            mask = self.revise(a, i, b, j)
+            if mask == self.domains[b]:
+                continue
+            self.narrow(b, mask, self.reasons[b] | self.reasons[a])
+            if not mask:
+                self.clear_queue()
+                return self.reasons[b]
+            self.enqueue(b, a)
+        return None
+
+    def clear_queue(self):
+        for arc in self.queue:
+            self.queued[arc[0]] = 0
+        self.queue.clear()
+
+    def learn(self, conflict):
+        if self.nogoods is None or conflict & (self.partial | self.pruned):
+            return
+        self.nogoods.add(self.lay.key, frozenset((x, self.assignments[x]) for x in bits(conflict)))
+
+    def over_bound(self):
+        # the conflict set for a branch that cannot beat bound, else None.
+        # It rests on every placement so far, and proves nothing; if it only
+        # holds for the tier-restricted domains, it is partial as well
+        lengths = self.lay.lengths
+        least = self.penalties.least
+        total = self.spent
+        for sid in self.unfilled:
+            if total >= self.bound:
+                break
+            total += least(lengths[sid], self.domains[sid])
+        # checked after the loop too, so a last placement that reaches bound
+        # is pruned with nothing left unfilled
+        if total < self.bound:
+            return None
+        res = self.pruned
+        for f in self.stack:
+            res |= 1 << f.sid
+        return res | self.tier_bound()
+
+    def tier_bound(self):
+        # self.partial if the slots' whole word lists could still beat bound
+        # where their tiers cannot, counting a failure on each restricted
+        # slot that would cost less, so widen() moves it on; else 0
+        lengths = self.lay.lengths
+        least = self.penalties.least
+        total = self.spent
+        cheaper = []
+        for sid in self.unfilled:
+            low = least(lengths[sid], self.domains[sid])
+            if self.restricted[sid]:
+                full = least(lengths[sid], self.pattern_mask(sid))
+                if full < low:
+                    cheaper.append(sid)
+                    low = full
+            total += low
+        if not cheaper or total >= self.bound:
+            return 0
+        for sid in cheaper:
+            self.failures[sid] += 1
+        return self.partial
+
+    def open_node(self):
+        # pick the next slot and push its frame; a conflict set if it has
+        # nothing left to try
+        sid = self.choose_slot()
+        cands, why = self.candidates(sid)
+        conflict = self.reasons[sid] | why
+        if not cands:
+            self.failures[sid] += 1
+            self.learn(conflict)
+            return conflict
+        self.unfilled.remove(sid)
+        self.placed[sid] = 1
+        self.stack.append(Frame(sid, cands, conflict))
+        return None
+
+    def place(self, f, w):
+        flat = self.flat
+        f.cell_mark = len(self.cell_trail)
+        for off, ch in zip(self.lay.cells[f.sid], w.encode()):
+            if not flat[off]:
+                flat[off] = ch
+                self.cell_trail.append(off)
+        self.assignments[f.sid] = w
+        self.used_words.add(w)
+        self.word_slot[w] = f.sid
+        if self.bound is not None:
+            self.spent += self.penalties.of(w)
+        f.word = w
+        f.mark = len(self.trail)
+
+    def retract(self, f):
+        self.undo(f.mark)
+        del self.assignments[f.sid]
+        self.used_words.remove(f.word)
+        del self.word_slot[f.word]
+        if self.bound is not None:
+            self.spent -= self.penalties.of(f.word)
+        flat = self.flat
+        cell_trail = self.cell_trail
+        while len(cell_trail) > f.cell_mark:
+            flat[cell_trail.pop()] = 0
+        f.word = None
+
+    def restart(self, exhausted=False):
+        # back to the root for a new run, first widening the tiers of the
+        # slots the last run failed on
+        while self.stack:
+            f = self.stack.pop()
+            if f.word is not None:
+                self.retract(f)
+            self.release(f.sid)
+        self.run += 1
+        self.runs.append(0)
+        if self.limits:
+            self.run_limit = self.nodes + next(self.limits)
+        self.descend = True
+        if self.widen(exhausted):
+            self.init_domains()
+
+    def step(self, n=1):
+        stop = self.nodes + n
+        res = None
+        while self.status is None:
+            if self.descend:
+                if not self.unfilled:
+                    self.status = 'filled'
+                    break
+                if self.nodes >= stop:
+                    break
+                if self.nodes >= self.run_limit:
+                    self.restart()
+                    continue
+                self.descend = False
+                self.nodes += 1
+                self.runs[-1] += 1
+                res = self.open_node()
+                if res is None:
+                    continue
+
+            if res is not None:
+                # the current value of the top frame (or, with no frame left,
+                # the whole run) failed with conflict set res
+                if not self.stack:
+                    if res & self.partial and (self.limits or any(self.restricted)):
+                        self.restart(exhausted=True)
+                        res = None
+                        continue
+                    self.status = 'failed'
+                    break
+                f = self.stack[-1]
+                bit = 1 << f.sid
+                if res & bit:
+                    self.learn(res)
+                self.retract(f)
+                if self.backjump and not res & bit:
+                    # this slot played no part in the failure: jump straight
+                    # back past it to the most recent culprit
+                    self.stack.pop()
+                    self.release(f.sid)
+                    continue
+                f.conflict |= res
+                res = None
+
+            f = self.stack[-1]
+            if f.pos == len(f.cands):
+                self.failures[f.sid] += 1
+                self.stack.pop()
+                self.release(f.sid)
+                res = f.conflict & ~(1 << f.sid)
+                self.learn(res)
+                continue
+            w = f.cands[f.pos]
+            f.pos += 1
+            if self.nogoods is not None:
+                hit = self.nogoods.check(self.lay.key, f.sid, w, self.assignments)
+                if hit is not None:
+                    for x, _ in hit:
+                        f.conflict |= 1 << x
+                    continue
+            self.place(f, w)
+            res = self.propagate_from(f.sid, w)
+            if res is None and self.bound is not None:
+                res = self.over_bound()
+            if res is None:
+                self.descend = True
+        return self.status
+
+
+def solve(slots, forced, index, order='score', limit=350, propagate='ac3', backjump=False,
+          nogoods=None, restarts=None, restart_base=200, budget=None, time_limit=None,
+          stats=None, cache=None, tiers=(), penalties=None, bound=None, exclude=()):
+    # run a FillSearch to the end, or until budget nodes / time_limit seconds
+    # are spent; stats, if given, gets the node count of every run and the
+    # final status (None if it was cut short)
+    search = FillSearch(slots, forced, index, order=order, limit=limit, propagate=propagate,
+                        backjump=backjump, nogoods=nogoods, restarts=restarts,
+                        restart_base=restart_base, cache=cache, tiers=tiers,
+                        penalties=penalties, bound=bound, exclude=exclude)
+    deadline = time.monotonic() + time_limit if time_limit is not None else None
+    while search.status is None:
+        n = 16
+        if budget is not None:
+            n = min(n, budget - search.nodes)
+            if n <= 0:
+                break
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        search.step(n)
+    if stats is not None:
+        stats['runs'] = search.runs
+        stats['status'] = search.status
+    if search.status == 'filled':
+        return search.assignments
+    return None
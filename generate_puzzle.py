@@ -1,6 +1,14 @@
+import multiprocessing
+import os
 import random
 import re
-from collections import defaultdict, deque
+from collections import Counter, defaultdict, deque
+
+import fill
+import localsearch
+import patterns
+import regions
+import wordlist
 
 SIZE = 13
 THEME = [
@@ -17,27 +25,22 @@ THEME = [
 ]
 
 def load_words():
-    by_len = defaultdict(set)
-    with open('/usr/share/dict/words', errors='ignore') as f:
-        for raw in f:
-            w = raw.strip()
-            if not w.isalpha():
-                continue
-            if w.lower() != w:
-                continue
-            w = w.upper()
-            if not (3 <= len(w) <= SIZE):
-                continue
-            if sum(ch in 'AEIOUY' for ch in w) == 0:
-                continue
-            if len(set(w)) <= 2 and len(w) > 4:
-                continue
-            by_len[len(w)].add(w)
-    for _, ans in THEME:
-        by_len[len(ans)].add(ans)
-    return {k: sorted(v) for k, v in by_len.items()}
-
-WORDS = load_words()
+    # words by length and their positional index; each length is loaded
+    # (from its compiled cache when fresh) the first time a solve needs it
+    index = wordlist.LazyIndex(SIZE, extra=[ans for _, ans in THEME])
+    return index.words, index
+
+WORDS, INDEX = load_words()
+# failures learned by one attempt are reused by later attempts on the same pattern
+NOGOODS = fill.NogoodStore()
+# pattern lookups are shared by every slot and attempt; see fill.PatternCache
+CACHE = fill.PatternCache(INDEX)
+# validated patterns are kept between runs too; see patterns.PatternLibrary
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.pattern_library.sqlite')
+LIBRARY = patterns.PatternLibrary(LIBRARY_PATH)
+# the most of a run's attempts that replay library patterns, so every run
+# still draws new ones
+LIBRARY_SHARE = 0.5
 
 class Slot:
     def __init__(self, sid, direction, cells):
@@ -64,6 +67,63 @@ def build_random_grid(block_prob=0.28):
     return g
 
 
+# new patterns lean toward slot lengths the word list fills easily, picking
+# the best of STEER_CHOICES block pairs at each step while keeping room for
+# the theme answers (patterns.fill_values, patterns.build_pattern); None
+# places blocks blind to the words
+STEER_CHOICES = 8
+FILL_VALUES = {}
+
+
+def fill_values():
+    if not FILL_VALUES:
+        FILL_VALUES.update(patterns.fill_values(INDEX, SIZE))
+    return FILL_VALUES
+
+
+def build_valid_grid(block_prob=0.28):
+    # a pattern that passes valid_pattern by construction; see patterns.build_pattern
+    if not STEER_CHOICES:
+        return patterns.build_pattern(SIZE, block_prob, 70, 110, 20, 40)
+    return patterns.build_pattern(SIZE, block_prob, 70, 110, 20, 40, values=fill_values(),
+                                  choices=STEER_CHOICES, lengths=[len(ans) for _, ans in THEME])
+
+
+# new patterns: 'build' makes each one with build_valid_grid; 'batch'
+# draws BATCH random ones at a time and keeps the valid ones
+# (batchpatterns, numpy)
+PATTERNS = 'build'
+BATCH = 2000
+
+
+def new_patterns(attempts):
+    if PATTERNS == 'batch':
+        import batchpatterns
+        for start in range(0, attempts, BATCH):
+            found = batchpatterns.sample_patterns(SIZE, min(BATCH, attempts - start), 0.10, 0.20,
+                                                  70, 110, 20, 40)
+            if STEER_CHOICES:
+                # the likeliest to fill first
+                found.sort(key=lambda b: -patterns.fill_estimate(b, fill_values()))
+            yield from found
+    else:
+        for _ in range(attempts):
+            yield build_valid_grid(block_prob=random.uniform(0.24, 0.34))
+
+
+def candidate_patterns(attempts):
+    # library patterns with a slot for every theme answer and no failed fill
+    # on record first, for at most LIBRARY_SHARE of attempts, then new
+    # ones, which go into the library for later runs
+    known = LIBRARY.matching(SIZE, [len(ans) for _, ans in THEME])
+    random.shuffle(known)
+    known = known[:int(attempts * LIBRARY_SHARE)]
+    yield from known
+    for blocks in new_patterns(attempts - len(known)):
+        LIBRARY.add(blocks)
+        yield blocks
+
+
 def extract_slots(blocks):
     slots = []
     sid = 0
@@ -156,20 +216,6 @@ def valid_pattern(blocks):
     return True
 
 
-def build_crossings(slots):
-    cell_to_slots = defaultdict(list)
-    for s in slots:
-        for idx, cell in enumerate(s.cells):
-            cell_to_slots[cell].append((s.sid, idx))
-    cross = defaultdict(list)
-    for cell, refs in cell_to_slots.items():
-        if len(refs) == 2:
-            (s1, i1), (s2, i2) = refs
-            cross[s1].append((i1, s2, i2))
-            cross[s2].append((i2, s1, i1))
-    return cross
-
-
 def assign_theme_slots(slots):
     slots_by_len = defaultdict(list)
     for s in slots:
@@ -203,100 +249,31 @@ def assign_theme_slots(slots):
     return None
 
 
-def solve_fill(slots, forced):
-    cross = build_crossings(slots)
-    slot_by_id = {s.sid: s for s in slots}
+# score_entries terms per word, for pruning fills that cannot beat the best
+PENALTIES = fill.PenaltyTable(INDEX, wordlist.word_penalty, key=wordlist.PENALTY_KEY)
 
-    assignments = dict(forced)
-    used_words = set(assignments.values())
 
-    # Grid letters from forced assignments
-    letters = {}
-    for sid, w in assignments.items():
-        s = slot_by_id[sid]
-        for i, cell in enumerate(s.cells):
-            ch = w[i]
-            if cell in letters and letters[cell] != ch:
-                return None
-            letters[cell] = ch
+# worker processes for filling the regions of patterns that split apart
+WORKERS = 4
+# 'backtrack', or 'local' for localsearch with LOCAL_SECONDS per pattern,
+# spent past the first fill on lowering its penalty
+ENGINE = 'backtrack'
+LOCAL_SECONDS = 10.0
 
-    unfilled = [s.sid for s in slots if s.sid not in assignments]
 
-    def candidates_for(sid):
-        s = slot_by_id[sid]
-        out = []
-        for w in WORDS.get(s.length, []):
-            if w in used_words:
-                continue
-            ok = True
-            for i, cell in enumerate(s.cells):
-                if cell in letters and letters[cell] != w[i]:
-                    ok = False
-                    break
-            if ok:
-                out.append(w)
-        random.shuffle(out)
-        return out[:250]  # prune to keep solve tractable
-
-    def choose_slot():
-        best_sid = None
-        best_cands = None
-        best_len = 10**9
-        for sid in unfilled:
-            cands = candidates_for(sid)
-            ln = len(cands)
-            if ln < best_len:
-                best_len = ln
-                best_sid = sid
-                best_cands = cands
-            if ln <= 1:
-                break
-        return best_sid, best_cands
-
-    def bt():
-        if not unfilled:
-            return True
-        sid, cands = choose_slot()
-        if not cands:
-            return False
-
-        s = slot_by_id[sid]
-        unfilled.remove(sid)
-
-        for w in cands:
-            changed = []
-            conflict = False
-            for i, cell in enumerate(s.cells):
-                ch = w[i]
-                prev = letters.get(cell)
-                if prev is not None and prev != ch:
-                    conflict = True
-                    break
-                if prev is None:
-                    letters[cell] = ch
-                    changed.append(cell)
-            if conflict:
-                for cell in changed:
-                    del letters[cell]
-                continue
-
-            assignments[sid] = w
-            used_words.add(w)
-
-            if bt():
-                return True
-
-            del assignments[sid]
-            used_words.remove(w)
-            for cell in changed:
-                del letters[cell]
-
-        unfilled.append(sid)
-        return False
-
-    if bt():
-        return assignments
-    return None
+def solve_fill(slots, forced, stats=None, bound=None, pool=None):
+    if ENGINE == 'local':
+        return localsearch.solve_local(slots, forced, INDEX, time_limit=LOCAL_SECONDS,
+                                       penalties=PENALTIES, polish=True, stats=stats)
+    # Luby restarts inside a fixed node budget, so one unlucky pattern
+    # cannot stall the attempt loop; slots draw on the best-ranked 4000
+    # words of their length until the fill keeps failing on them. With a
+    # bound, only fills scoring below it are searched for. Patterns that
+    # split into regions have them filled separately, on pool across a separator
+    return regions.solve_regions(slots, forced, INDEX, pool=pool, order='score', limit=None,
+                                 nogoods=NOGOODS, restarts='luby', restart_base=100,
+                                 budget=6000, stats=stats, cache=CACHE, tiers=(4000, 12000),
+                                 penalties=PENALTIES, bound=bound)
 
 
 def build_solution(blocks, slots, assignments):
@@ -338,44 +315,67 @@ def collect_entries(grid):
 
 
 def score_entries(across, down):
-    entries = across + down
-    penalty = 0
-    bad_chunks = ['Q','X','Z','J']
-    for _, w, _, _ in entries:
-        if any(ch*3 in w for ch in set(w)):
-            penalty += 3
-        penalty += sum(w.count(ch) for ch in bad_chunks) * 0.5
-        if len(set(w)) <= 2:
-            penalty += 5
-    return penalty
+    return sum(PENALTIES.of(w) for _, w, _, _ in across + down)
 
 
 def main():
     best = None
-    for attempt in range(1200):
-        blocks = build_random_grid(block_prob=random.uniform(0.24, 0.34))
-        if not valid_pattern(blocks):
-            continue
-        slots = extract_slots(blocks)
-        forced = assign_theme_slots(slots)
-        if not forced:
-            continue
-        assignments = solve_fill(slots, forced)
-        if not assignments:
-            continue
-        grid = build_solution(blocks, slots, assignments)
-        across, down = collect_entries(grid)
-        theme_words = {a for _, a in THEME}
-        all_words = {w for _, w, _, _ in across + down}
-        if not theme_words.issubset(all_words):
-            continue
-        sc = score_entries(across, down)
-        if best is None or sc < best[0]:
-            best = (sc, grid, across, down)
-            print('candidate', attempt, 'score', sc, 'across', len(across), 'down', len(down))
-            if sc < 8:
-                break
-
+    # compile every length's cache file before the workers start, so they
+    # only ever map them; nothing is loaded here until a fill needs it
+    INDEX.prepare(range(3, SIZE + 1))
+    # the workers only fill regions for the backtracking engine
+    pool = multiprocessing.Pool(WORKERS) if ENGINE == 'backtrack' else None
+    # what became of each pattern tried, by patterns.canonical, so a pattern
+    # drawn again, turned or not, is skipped: 'invalid', 'theme' (no room
+    # for the theme answers), 'failed' or 'filled'
+    seen = {}
+    repeats = 0
+    try:
+        for attempt, blocks in enumerate(candidate_patterns(1200)):
+            key = patterns.canonical(blocks)
+            if key in seen:
+                repeats += 1
+                continue
+            if not valid_pattern(blocks):
+                seen[key] = 'invalid'
+                continue
+            slots = extract_slots(blocks)
+            forced = assign_theme_slots(slots)
+            if not forced:
+                seen[key] = 'theme'
+                continue
+            stats = {}
+            bound = best[0] if best else None
+            assignments = solve_fill(slots, forced, stats, bound, pool)
+            if not assignments:
+                seen[key] = 'failed'
+                # the library skips it in later runs; failing under a bound only
+                # says it cannot beat this run's best
+                if bound is None:
+                    LIBRARY.record(blocks, 'failed')
+                continue
+            grid = build_solution(blocks, slots, assignments)
+            across, down = collect_entries(grid)
+            theme_words = {a for _, a in THEME}
+            all_words = {w for _, w, _, _ in across + down}
+            if not theme_words.issubset(all_words):
+                seen[key] = 'failed'
+                continue
+            seen[key] = 'filled'
+            LIBRARY.record(blocks, 'filled')
+            sc = score_entries(across, down)
+            if best is None or sc < best[0]:
+                best = (sc, grid, across, down)
+                print('candidate', attempt, 'score', sc, 'across', len(across), 'down', len(down),
+                      'nodes per restart', stats.get('runs'))
+                if sc < 8:
+                    break
+    finally:
+        # outcomes recorded so far are kept even if an attempt raises
+        if pool is not None:
+            pool.terminate()
+        LIBRARY.flush()
+    print('patterns', dict(Counter(seen.values())), 'repeats skipped', repeats)
     if not best:
         print('NO SOLUTION')
         return
@@ -1,5 +1,13 @@
+import multiprocessing
+import os
 import random
-from collections import defaultdict, deque
+from collections import Counter, defaultdict, deque
+
+import fill
+import localsearch
+import patterns
+import regions
+import wordlist
 
 SIZE = 15
 THEME = [
@@ -18,44 +26,12 @@ THEME = [
 random.seed(7)
 
 def load_words():
-    by_len = defaultdict(set)
-    with open('/usr/share/dict/words', errors='ignore') as f:
-        for raw in f:
-            w = raw.strip()
-            if not w.isalpha() or w.lower() != w:
-                continue
-            w = w.upper()
-            L = len(w)
-            if L < 3 or L > SIZE:
-                continue
-            if sum(ch in 'AEIOUY' for ch in w) == 0:
-                continue
-            if len(set(w)) <= 2 and L > 4:
-                continue
-            # trim very weird words
-            weird = sum(ch in 'JQXZ' for ch in w)
-            if weird > 2:
-                continue
-            by_len[L].add(w)
-    for _, ans in THEME:
-        by_len[len(ans)].add(ans)
-    # shrink huge buckets to keep search tractable
-    out = {}
-    for L, ws in by_len.items():
-        ws = sorted(ws)
-        if len(ws) > 12000:
-            # sample deterministic-ish spread
-            step = len(ws) / 12000
-            picked = []
-            x = 0.0
-            while len(picked) < 12000 and int(x) < len(ws):
-                picked.append(ws[int(x)])
-                x += step
-            ws = picked
-        out[L] = ws
-    return out
-
-WORDS = load_words()
+    # words by length and their positional index; each length is loaded
+    # (from its compiled cache when fresh) the first time a solve needs it
+    index = wordlist.LazyIndex(SIZE, extra=[ans for _, ans in THEME], max_weird=2)
+    return index.words, index
+
+WORDS, INDEX = load_words()
 
 class Slot:
     __slots__ = ("sid", "direction", "cells", "length")
@@ -82,6 +58,65 @@ def rand_blocks(p):
     return b
 
 
+# new patterns lean toward slot lengths the word list fills easily, picking
+# the best of STEER_CHOICES block pairs at each step while keeping room for
+# the theme answers (patterns.fill_values, patterns.build_pattern); None
+# places blocks blind to the words
+STEER_CHOICES = 8
+FILL_VALUES = {}
+
+
+def fill_values():
+    if not FILL_VALUES:
+        FILL_VALUES.update(patterns.fill_values(INDEX, SIZE))
+    return FILL_VALUES
+
+
+def valid_blocks(p):
+    # blocks passing valid_pattern's shape checks by construction; the theme
+    # lengths are still up to theme_lengths_ok
+    if not STEER_CHOICES:
+        return patterns.build_pattern(SIZE, p, 95, 145, 38, 72)
+    return patterns.build_pattern(SIZE, p, 95, 145, 38, 72, values=fill_values(),
+                                  choices=STEER_CHOICES, lengths=[len(ans) for _, ans in THEME])
+
+
+# new patterns: 'build' makes each one with valid_blocks; 'batch' draws
+# BATCH random ones at a time and keeps those valid_pattern would pass
+# (batchpatterns, numpy)
+PATTERNS = 'build'
+BATCH = 2000
+
+
+def new_patterns(attempts):
+    if PATTERNS == 'batch':
+        import batchpatterns
+        lengths = [len(ans) for _, ans in THEME]
+        for start in range(0, attempts, BATCH):
+            found=batchpatterns.sample_patterns(SIZE, min(BATCH, attempts-start), 0.10, 0.20,
+                                                95, 145, 38, 72, lengths=lengths)
+            if STEER_CHOICES:
+                # the likeliest to fill first
+                found.sort(key=lambda b: -patterns.fill_estimate(b, fill_values()))
+            yield from found
+    else:
+        for _ in range(attempts):
+            yield valid_blocks(random.uniform(0.23,0.31))
+
+
+def candidate_patterns(attempts):
+    # library patterns with a slot for every theme answer and no failed fill
+    # on record first, for at most LIBRARY_SHARE of attempts, then new
+    # ones, which go into the library for later runs
+    known = LIBRARY.matching(SIZE, [len(ans) for _, ans in THEME])
+    random.shuffle(known)
+    known = known[:int(attempts * LIBRARY_SHARE)]
+    yield from known
+    for blocks in new_patterns(attempts - len(known)):
+        LIBRARY.add(blocks)
+        yield blocks
+
+
 def white_list(b):
     return [(r,c) for r in range(SIZE) for c in range(SIZE) if not b[r][c]]
 
@@ -143,6 +178,10 @@ def extract_slots(b):
 
 
 def valid_pattern(b):
+    return valid_shape(b) and theme_lengths_ok(extract_slots(b))
+
+
+def valid_shape(b):
     nwhite = len(white_list(b))
     if nwhite < 95 or nwhite > 145:
         return False
@@ -153,6 +192,10 @@ def valid_pattern(b):
     slots = extract_slots(b)
     if len(slots) < 38 or len(slots) > 72:
         return False
+    return True
+
+
+def theme_lengths_ok(slots):
     lengths = defaultdict(int)
     for s in slots:
         lengths[s.length]+=1
@@ -182,122 +225,45 @@ def theme_to_slots(slots):
     return mapping if bt(0) else None
 
 
-def build_indexes(words_by_len):
-    idx = {}
-    for L, ws in words_by_len.items():
-        pos = [defaultdict(set) for _ in range(L)]
-        for i,w in enumerate(ws):
-            for p,ch in enumerate(w):
-                pos[p][ch].add(i)
-        idx[L] = (ws, pos)
-    return idx
+# failures learned by one attempt are reused by later attempts on the same pattern
+NOGOODS = fill.NogoodStore()
+# pattern lookups are shared by every slot and attempt; see fill.PatternCache
+CACHE = fill.PatternCache(INDEX)
+# validated patterns are kept between runs too; see patterns.PatternLibrary
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.pattern_library.sqlite')
+LIBRARY = patterns.PatternLibrary(LIBRARY_PATH)
+# the most of a run's attempts that replay library patterns, so every run
+# still draws new ones
+LIBRARY_SHARE = 0.5
 
-INDEX = build_indexes(WORDS)
 
+def word_bad(w):
+    return sum(ch in 'JQXZ' for ch in w) + (3 if len(set(w))<=2 else 0)
+
+# per-word weirdness as main scores it, for pruning fills that cannot win;
+# its groups are kept on disk under key, so change key along with word_bad
+PENALTIES = fill.PenaltyTable(INDEX, word_bad, key='word_bad-1')
 
-def solve(slots, forced):
-    slot_map={s.sid:s for s in slots}
-    cell_refs=defaultdict(list)
-    for s in slots:
-        for i,cell in enumerate(s.cells):
-            cell_refs[cell].append((s.sid,i))
-
-    letters={}
-    assign=dict(forced)
-    used=set(assign.values())
-
-    for sid,w in forced.items():
-        s=slot_map[sid]
-        for i,cell in enumerate(s.cells):
-            ch=w[i]
-            if cell in letters and letters[cell]!=ch:
-                return None
-            letters[cell]=ch
-
-    unfilled=[s.sid for s in slots if s.sid not in assign]
-
-    cache={}
-    def candidates(sid):
-        key=(sid,tuple(sorted((cell,ch) for cell,ch in letters.items() if cell in set(slot_map[sid].cells))))
-        if key in cache:
-            return cache[key]
-        s=slot_map[sid]
-        L=s.length
-        if L not in INDEX:
-            cache[key]=[]; return []
-        ws,pos=INDEX[L]
-        possible=None
-        for i,cell in enumerate(s.cells):
-            ch=letters.get(cell)
-            if ch is None:
-                continue
-            ids=pos[i].get(ch,set())
-            if possible is None:
-                possible=set(ids)
-            else:
-                possible &= ids
-            if not possible:
-                cache[key]=[]; return []
-        if possible is None:
-            ids=range(len(ws))
-        else:
-            ids=possible
-        out=[]
-        for wi in ids:
-            w=ws[wi]
-            if w in used:
-                continue
-            out.append(w)
-        # heuristic ordering: more vowels first
-        out.sort(key=lambda w:(sum(ch in 'AEIOU' for ch in w), -len(set(w))), reverse=True)
-        if len(out)>350:
-            out=out[:350]
-        cache[key]=out
-        return out
-
-    def choose():
-        best=None; bestc=None; bestn=10**9
-        for sid in unfilled:
-            c=candidates(sid)
-            n=len(c)
-            if n<bestn:
-                bestn=n; best=sid; bestc=c
-            if n<=1:
-                break
-        return best,bestc
-
-    def bt(depth=0):
-        if not unfilled:
-            return True
-        sid,cands=choose()
-        if not cands:
-            return False
-        s=slot_map[sid]
-        unfilled.remove(sid)
-        for w in cands:
-            changed=[]
-            bad=False
-            for i,cell in enumerate(s.cells):
-                ch=w[i]
-                prev=letters.get(cell)
-                if prev is not None and prev!=ch:
-                    bad=True; break
-                if prev is None:
-                    letters[cell]=ch; changed.append(cell)
-            if bad:
-                for cell in changed: del letters[cell]
-                continue
-            assign[sid]=w; used.add(w)
-            if bt(depth+1):
-                return True
-            del assign[sid]; used.remove(w)
-            for cell in changed: del letters[cell]
-        unfilled.append(sid)
-        return False
 
-    if bt():
-        return assign
-    return None
+WORKERS = 4
+# 'backtrack', or 'local' for localsearch with LOCAL_SECONDS per pattern,
+# spent past the first fill on lowering its penalty
+ENGINE = 'backtrack'
+LOCAL_SECONDS = 10.0
+
+
+def solve(slots, forced, stats=None, bound=None, pool=None):
+    if ENGINE == 'local':
+        return localsearch.solve_local(slots, forced, INDEX, time_limit=LOCAL_SECONDS,
+                                       penalties=PENALTIES, polish=True, stats=stats)
+    # the best-ranked 4000 words of each length first, widening to 12000 and
+    # then the full list slot by slot where the fill keeps failing; with a
+    # bound, only fills less weird than it are searched for. a pattern that
+    # splits into regions gets them filled separately, on pool across a separator
+    return regions.solve_regions(slots, forced, INDEX, pool=pool, order='score', limit=None,
+                                 nogoods=NOGOODS, restarts='luby', restart_base=100,
+                                 budget=6000, stats=stats, cache=CACHE, tiers=(4000, 12000),
+                                 penalties=PENALTIES, bound=bound)
 
 
 def make_grid(blocks, slots, assign):
@@ -331,32 +297,58 @@ def collect(grid):
 
 def main():
     best=None
-    for att in range(800):
-        blocks=rand_blocks(random.uniform(0.23,0.31))
-        if not valid_pattern(blocks):
-            continue
-        slots=extract_slots(blocks)
-        forced=theme_to_slots(slots)
-        if not forced:
-            continue
-        assign=solve(slots, forced)
-        if not assign:
-            continue
-        grid=make_grid(blocks,slots,assign)
-        across,down=collect(grid)
-        words={w for _,w,_,_ in across+down}
-        if not all(ans in words for _,ans in THEME):
-            continue
-        # score weirdness
-        bad=0
-        for _,w,_,_ in across+down:
-            bad += sum(ch in 'JQXZ' for ch in w)
-            if len(set(w))<=2: bad+=3
-        if best is None or bad<best[0]:
-            best=(bad,grid,across,down)
-            print('candidate',att,'bad',bad,'across',len(across),'down',len(down))
-            if bad<=6:
-                break
+    # compile every length's cache file before the workers start, so they
+    # only ever map them; nothing is loaded here until a fill needs it
+    INDEX.prepare(range(3, SIZE+1))
+    # workers only fill regions for the backtracking engine
+    pool=multiprocessing.Pool(WORKERS) if ENGINE=='backtrack' else None
+    # outcome of each pattern tried, by patterns.canonical: 'invalid',
+    # 'theme', 'failed' or 'filled'; a pattern met again, turned or not, is
+    # skipped
+    seen={}
+    repeats=0
+    try:
+        for att, blocks in enumerate(candidate_patterns(800)):
+            key=patterns.canonical(blocks)
+            if key in seen:
+                repeats+=1; continue
+            if not valid_shape(blocks):
+                seen[key]='invalid'; continue
+            slots=extract_slots(blocks)
+            if not theme_lengths_ok(slots):
+                seen[key]='theme'; continue
+            forced=theme_to_slots(slots)
+            if not forced:
+                seen[key]='theme'; continue
+            stats={}
+            bound=best[0] if best else None
+            assign=solve(slots, forced, stats, bound, pool)
+            if not assign:
+                seen[key]='failed'
+                # later runs skip it, unless it only failed to beat this run's best
+                if bound is None:
+                    LIBRARY.record(blocks, 'failed')
+                continue
+            grid=make_grid(blocks,slots,assign)
+            across,down=collect(grid)
+            words={w for _,w,_,_ in across+down}
+            if not all(ans in words for _,ans in THEME):
+                seen[key]='failed'; continue
+            seen[key]='filled'
+            LIBRARY.record(blocks, 'filled')
+            # score weirdness
+            bad=sum(PENALTIES.of(w) for _,w,_,_ in across+down)
+            if best is None or bad<best[0]:
+                best=(bad,grid,across,down)
+                print('candidate',att,'bad',bad,'across',len(across),'down',len(down),'nodes per restart',stats.get('runs'))
+                if bad<=6:
+                    break
+    finally:
+        # keep the outcomes recorded so far even if an attempt raises
+        if pool is not None:
+            pool.terminate()
+        LIBRARY.flush()
+    print('patterns',dict(Counter(seen.values())),'repeats skipped',repeats)
     if not best:
         print('NO SOLUTION'); return
     bad,grid,across,down=best
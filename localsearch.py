@@ -0,0 +1,277 @@
+import math
+import random
+import time
+
+import fill
+
+
+def tally(masks):
+    # how many of masks hold each word, as the binary digits of the counts,
+    # lowest first, each digit a mask over the words
+    digits = []
+    for carry in masks:
+        for d in range(len(digits)):
+            digits[d], carry = digits[d] ^ carry, digits[d] & carry
+            if not carry:
+                break
+        if carry:
+            digits.append(carry)
+    return digits
+
+
+class LocalSearch:
+    # min-conflicts fill: every open slot always holds some word, and each
+    # step rewrites one slot that disagrees with a crossing to the word
+    # breaking the fewest of its crossings, best-ranked first. Noise, which
+    # cools from noise to a tenth of it over the time budget, sometimes
+    # takes a word that only fits the pinned letters instead; a short tabu
+    # list keeps a slot from flipping straight back. Forced entries are
+    # pinned throughout, and no word is used twice.
+    #
+    # With polish, a conflict-free fill keeps being improved until the time
+    # is up; otherwise the first conflict-free fill ends the search. Each
+    # polish step moves a slot to a word with a lower penalty (a
+    # fill.PenaltyTable) that fits its pinned crossings, even one breaking
+    # others: a move raising the cost, weight penalty points per broken
+    # crossing, is taken with probability exp(-rise / temperature), the
+    # temperature cooling from heat to a tenth of it. Min-conflicts steps
+    # then mend the grid; if they have not within repair steps, the search
+    # goes back to the best fill found
+    def __init__(self, slots, forced, index, penalties=None, noise=0.05, tabu=8, polish=False,
+                 spread=16, heat=1.0, weight=2.0, repair=200):
+        lay = slots if isinstance(slots, fill.Layout) else fill.Layout(slots)
+        self.lay = lay
+        self.index = index
+        self.penalties = penalties
+        self.noise = noise
+        self.tabu = tabu
+        self.polish = polish
+        self.spread = spread
+        self.heat = heat
+        self.weight = weight
+        self.repair = repair
+        self.mending = None  # step of the polish move the conflicts came from
+        self.pinned = set(forced)
+        self.words = [None] * lay.n
+        self.ids = [-1] * lay.n
+        self.used = {}  # length -> mask of the word ids in the grid
+        self.recent = {}  # (sid, word id) -> step it stays tabu until
+        self.steps = 0
+        self.bad = [0] * lay.n  # crossings of each slot that disagree
+        self.conflicts = 0
+        self.open = [sid for sid in lay.sids if sid not in self.pinned]
+        for sid, w in forced.items():
+            self.put(sid, w)
+        # forced entries that disagree at a crossing cannot be mended, as
+        # nothing moves them; FillSearch fails on them the same way
+        self.status = 'failed' if self.conflicts else None
+        # nor can an open slot that no free word fits at its pinned crossings
+        for sid in self.open:
+            L = lay.lengths[sid]
+            if L not in index or not self.fits(sid)[0] & ~self.used.get(L, 0):
+                self.status = 'failed'
+        order = list(self.open)
+        random.shuffle(order)
+        for sid in order:
+            self.move(sid, 0.0)
+        self.best = None
+        self.best_ids = None
+        self.best_cost = None
+        self.keep()
+
+    def word_id(self, sid, w):
+        L = self.lay.lengths[sid]
+        if L in self.index:
+            for wi, x in enumerate(self.index[L][0]):
+                if x == w:
+                    return wi
+        return -1
+
+    def put(self, sid, w, wi=None):
+        # write w into sid, keeping the used masks and conflict counts
+        L = self.lay.lengths[sid]
+        if self.words[sid] is not None and self.ids[sid] >= 0:
+            self.used[L] = self.used.get(L, 0) & ~(1 << self.ids[sid])
+        old = self.words[sid]
+        for i, other, j in self.lay.cross[sid]:
+            theirs = self.words[other]
+            if theirs is None:
+                continue
+            was = old is not None and old[i] != theirs[j]
+            now = w[i] != theirs[j]
+            if was != now:
+                d = 1 if now else -1
+                self.bad[sid] += d
+                self.bad[other] += d
+                self.conflicts += d
+        self.words[sid] = w
+        self.ids[sid] = self.word_id(sid, w) if wi is None else wi
+        if self.ids[sid] >= 0:
+            self.used[L] = self.used.get(L, 0) | (1 << self.ids[sid])
+
+    def fits(self, sid):
+        # (mask of the words agreeing with every pinned crossing, masks of
+        # the words agreeing with each other filled crossing)
+        L = self.lay.lengths[sid]
+        ws, pos = self.index[L]
+        hard = (1 << len(ws)) - 1
+        soft = []
+        for i, other, j in self.lay.cross[sid]:
+            theirs = self.words[other]
+            if theirs is None:
+                continue
+            m = pos[i].get(theirs[j], 0)
+            if other in self.pinned:
+                hard &= m
+            else:
+                soft.append(m)
+        return hard, soft
+
+    def move(self, sid, noise):
+        L = self.lay.lengths[sid]
+        if L not in self.index:
+            return
+        ws = self.index[L][0]
+        hard, soft = self.fits(sid)
+        free = ~self.used.get(L, 0)  # every word in the grid, sid's own too
+        choices = hard & free
+        if not (noise and random.random() < noise):
+            # the words agreeing with the most filled crossings: per-word
+            # counts kept bit-sliced, one int per binary digit, then the
+            # highest count picked digit by digit from the top
+            for digit in reversed(tally(soft)):
+                if choices & digit:
+                    choices &= digit
+        picks = []
+        for wi in fill.bits(choices):
+            if self.recent.get((sid, wi), -1) < self.steps:
+                picks.append(wi)
+                if len(picks) == self.spread:
+                    break
+        if not picks:
+            return
+        wi = random.choice(picks)
+        if self.tabu:
+            self.recent[(sid, wi)] = self.steps + self.tabu
+        self.put(sid, ws[wi], wi)
+
+    def improve(self, sid, temperature):
+        # a polish step: move sid to a cheaper word fitting its pinned
+        # crossings, of those agreeing with the most others; True if the
+        # move broke crossings. A slot still empty is left to move()
+        L = self.lay.lengths[sid]
+        if L not in self.index or self.words[sid] is None:
+            return False
+        ws = self.index[L][0]
+        now = self.penalties.of(self.words[sid])
+        cheaper = 0
+        for p, m in self.penalties.classes(L):
+            if p >= now:
+                break
+            cheaper |= m
+        hard, soft = self.fits(sid)
+        choices = cheaper & hard & ~self.used.get(L, 0)
+        for digit in reversed(tally(soft)):
+            if choices & digit:
+                choices &= digit
+        picks = []
+        for wi in fill.bits(choices):
+            if self.recent.get((sid, wi), -1) < self.steps:
+                picks.append(wi)
+                if len(picks) == self.spread:
+                    break
+        if not picks:
+            return False
+        wi = random.choice(picks)
+        w = ws[wi]
+        broken = sum(w[i] != self.words[other][j] for i, other, j in self.lay.cross[sid]
+                     if self.words[other] is not None) - self.bad[sid]
+        rise = self.weight * broken + self.penalties.of(w) - now
+        if rise > 0 and random.random() >= math.exp(-rise / temperature):
+            return False
+        if self.tabu:
+            # so the mending does not put the old word straight back
+            self.recent[(sid, self.ids[sid])] = self.steps + self.tabu
+        self.put(sid, w, wi)
+        return broken > 0
+
+    def restore(self):
+        # the grid back to the best fill found, counts rebuilt from scratch
+        self.words = [None] * self.lay.n
+        self.ids = [-1] * self.lay.n
+        self.used = {}
+        self.bad = [0] * self.lay.n
+        self.conflicts = 0
+        for sid, w in self.best.items():
+            self.put(sid, w, self.best_ids[sid])
+
+    def penalty(self):
+        if self.penalties is None:
+            return 0
+        return sum(self.penalties.of(w) for w in self.words if w is not None)
+
+    def keep(self):
+        cost = (self.conflicts, self.penalty())
+        if self.best_cost is None or cost < self.best_cost:
+            self.best_cost = cost
+            self.best = {sid: self.words[sid] for sid in self.lay.sids
+                         if self.words[sid] is not None}
+            self.best_ids = list(self.ids)
+
+    def run(self, time_limit, max_steps=None):
+        start = time.monotonic()
+        deadline = start + time_limit
+        noise = self.noise
+        temperature = self.heat
+        while self.open and self.status is None:
+            if max_steps is not None and self.steps >= max_steps:
+                break
+            if not self.steps % 64:
+                now = time.monotonic()
+                if now > deadline:
+                    break
+                cooled = 1 - 0.9 * (now - start) / time_limit
+                noise = self.noise * cooled
+                temperature = self.heat * cooled
+            self.steps += 1
+            if self.conflicts:
+                if self.mending is not None and self.steps - self.mending > self.repair:
+                    self.restore()
+                    self.mending = None
+                    continue
+                bad = [sid for sid in self.open if self.bad[sid]]
+                if not bad:
+                    break
+                self.move(random.choice(bad), noise)
+            elif self.polish and self.penalties is not None:
+                self.mending = None
+                if self.improve(random.choice(self.open), temperature):
+                    self.mending = self.steps
+            else:
+                break
+            if self.conflicts <= self.best_cost[0]:
+                self.keep()
+        self.keep()
+        return self.best, self.best_cost[0]
+
+
+def local_search(slots, forced, index, time_limit=10.0, penalties=None, polish=False,
+                 stats=None, **kw):
+    # the best grid found in time_limit seconds and how many crossings it
+    # still breaks
+    search = LocalSearch(slots, forced, index, penalties=penalties, polish=polish, **kw)
+    best, conflicts = search.run(time_limit)
+    if stats is not None:
+        stats['steps'] = search.steps
+        stats['conflicts'] = conflicts
+        stats['penalty'] = search.best_cost[1]
+    return best, conflicts
+
+
+def solve_local(slots, forced, index, time_limit=10.0, penalties=None, polish=False,
+                stats=None, **kw):
+    # local_search with fill.solve's contract: a conflict-free fill or None
+    lay = fill.Layout(slots)
+    best, conflicts = local_search(lay, forced, index, time_limit=time_limit,
+                                   penalties=penalties, polish=polish, stats=stats, **kw)
+    return best if not conflicts and len(best) == len(lay.sids) else None
@@ -0,0 +1,298 @@
+import math
+import random
+import sqlite3
+from collections import Counter
+
+# Block patterns are lists of rows of booleans, True for a block, and are
+# symmetric under a half turn, as the scripts build them.
+
+
+def mirror(size, r, c):
+    return size - 1 - r, size - 1 - c
+
+
+def line_runs(blocks, size, line):
+    # lengths of the white runs along one row ('r', i) or column ('c', j)
+    kind, i = line
+    runs = []
+    n = 0
+    for x in range(size):
+        if blocks[i][x] if kind == 'r' else blocks[x][i]:
+            if n:
+                runs.append(n)
+            n = 0
+        else:
+            n += 1
+    if n:
+        runs.append(n)
+    return runs
+
+
+def pattern_text(blocks):
+    return '/'.join(''.join('#' if b else '.' for b in row) for row in blocks)
+
+
+def orientations(blocks):
+    # the pattern under each of the square's eight symmetries
+    out = []
+    g = blocks
+    for _ in range(4):
+        g = [list(row) for row in zip(*g[::-1])]
+        out.append(g)
+        out.append([list(row) for row in zip(*g)])
+    return out
+
+
+def canonical(blocks):
+    # one text for a pattern and all its turns and reflections, which fill
+    # alike (a reflection at worst swaps across and down)
+    return min(pattern_text(g) for g in orientations(blocks))
+
+
+def slot_lengths(blocks, min_run=3):
+    # the pattern's slot lengths, across and down, sorted
+    size = len(blocks)
+    lines = [('r', i) for i in range(size)] + [('c', i) for i in range(size)]
+    return tuple(sorted(n for line in lines for n in line_runs(blocks, size, line) if n >= min_run))
+
+
+def whites_connected(blocks, size, whites):
+    # whether all of the whites white cells are reachable from the first one
+    start = next(((r, c) for r in range(size) for c in range(size) if not blocks[r][c]), None)
+    if start is None:
+        return False
+    seen = {start}
+    stack = [start]
+    while stack:
+        r, c = stack.pop()
+        for nr, nc in ((r + 1, c), (r - 1, c), (r, c + 1), (r, c - 1)):
+            if 0 <= nr < size and 0 <= nc < size and not blocks[nr][nc] and (nr, nc) not in seen:
+                seen.add((nr, nc))
+                stack.append((nr, nc))
+    return len(seen) == whites
+
+
+def letter_counts(index, L):
+    # (words of length L, [{letter: words with it there} per position]); a
+    # wordlist.LazyIndex reads these from its compiled file headers without
+    # loading any words
+    if hasattr(index, 'letter_counts'):
+        return index.letter_counts(L)
+    if L not in index:
+        return 0, []
+    ws, pos = index[L]
+    return len(ws), [{ch: m.bit_count() for ch, m in masks.items()} for masks in pos]
+
+
+def fill_values(index, max_len, min_run=3):
+    # {length: rough log2 of the ways a slot of that length fills}: its
+    # bucket size, less the odds that each of its cells agrees with the
+    # crossing slot, taken from the positional letter counts and charged
+    # half to each of the two slots. Summed over a pattern's slots it
+    # estimates log2 of the pattern's fills; long slots come out well below
+    # short ones even where their buckets are large
+    values = {}
+    for L in range(min_run, max_len + 1):
+        n, counts = letter_counts(index, L)
+        if not n:
+            values[L] = -64.0
+            continue
+        agree = sum((k / n) ** 2 for at in counts for k in at.values()) / L
+        values[L] = math.log2(n) + L / 2 * math.log2(agree)
+    return values
+
+
+def fill_estimate(blocks, values, min_run=3):
+    return sum(values.get(L, -64.0) for L in slot_lengths(blocks, min_run))
+
+
+def build_pattern(size, block_prob, min_white, max_white, min_slots, max_slots, min_run=3,
+                  values=None, choices=8, lengths=(), keep=32.0):
+    # a symmetric pattern built one block pair at a time from an open grid,
+    # each pair kept only if every run through it is still at least min_run
+    # long, the whites still connect and the slots still number at most
+    # max_slots, so every pattern returned passes the scripts' checks.
+    # Pairs are tried in random order until about block_prob of the grid is
+    # blocked, and past that until the white and slot counts are in range.
+    # The slots left under max_slots are paced over the pairs still to
+    # place, so early pairs that split many runs cannot use them all up;
+    # when a round over the grid places nothing the pace is eased, and
+    # after a few such rounds the grid is started over.
+    #
+    # With values (see fill_values), pairs are steered toward slot lengths
+    # the dictionary fills easily: of each choices pairs that would do, the
+    # one raising the pattern's fill estimate most is placed. Each slot
+    # that a length in lengths (the theme answers', counted with repeats)
+    # still has counts keep bits more, so the steering does not shorten
+    # away the slots the theme needs
+    cells = [(r, c) for r in range(size) for c in range(size) if (r, c) <= mirror(size, r, c)]
+    area = size * size
+    target = min(max(round(block_prob * area), area - max_white), area - min_white)
+    batch = 1 if values is None else choices
+    need = Counter(lengths)
+
+    def trial(pair, allow):
+        # (fill estimate gained, slots gained, {length: slots gained}) if
+        # pair would do, else None
+        lines = {('r', x) for x, _ in pair} | {('c', y) for _, y in pair}
+        before = [line_runs(blocks, size, line) for line in lines]
+        for x, y in pair:
+            blocks[x][y] = True
+        after = [line_runs(blocks, size, line) for line in lines]
+        for x, y in pair:
+            blocks[x][y] = False
+        gained = sum(len(runs) for runs in after) - sum(len(runs) for runs in before)
+        if gained > allow or slots + gained > max_slots or \
+                any(n < min_run for runs in after for n in runs):
+            return None
+        if values is None:
+            return 0.0, gained, {}
+        change = Counter(n for runs in after for n in runs)
+        change.subtract(n for runs in before for n in runs)
+        gain = sum(values.get(n, -64.0) * k for n, k in change.items())
+        for n, k in change.items():
+            if n in need:
+                gain += keep * (min(have[n] + k, need[n]) - min(have[n], need[n]))
+        return gain, gained, change
+
+    while True:
+        blocks = [[False] * size for _ in range(size)]
+        whites = area
+        slots = 2 * size if size >= min_run else 0
+        have = Counter({size: slots})
+        slack = 0
+        while slack <= 4:
+            placed = False
+            random.shuffle(cells)
+            pending = []
+            for i, (r, c) in enumerate(cells):
+                if area - whites >= target and slots >= min_slots:
+                    break
+                if blocks[r][c]:
+                    continue
+                pair = {(r, c), mirror(size, r, c)}
+                if whites - len(pair) < min_white:
+                    continue
+                pairs_left = max((target - (area - whites) - len(pair) + 1) // 2, 0)
+                found = trial(pair, (max_slots - slots) // (pairs_left + 1) + slack)
+                if found is not None:
+                    pending.append((found, pair))
+                if pending and (len(pending) == batch or i == len(cells) - 1):
+                    pending.sort(key=lambda p: -p[0][0])
+                    for (_, gained, change), pair in pending:
+                        for x, y in pair:
+                            blocks[x][y] = True
+                        if whites_connected(blocks, size, whites - len(pair)):
+                            whites -= len(pair)
+                            slots += gained
+                            have.update(change)
+                            placed = True
+                            break
+                        for x, y in pair:
+                            blocks[x][y] = False
+                    pending = []
+            if area - whites >= target and slots >= min_slots:
+                break
+            if not placed:
+                slack += 1
+        if min_white <= whites <= max_white and min_slots <= slots <= max_slots:
+            return blocks
+
+
+class PatternLibrary:
+    # validated patterns kept in an SQLite file between runs, per grid size,
+    # indexed by their multiset of slot lengths. matching(lengths) gives
+    # the patterns with a slot for each of lengths (counted with repeats)
+    # from an index of (length, count) -> the multisets with at least that
+    # many slots of the length, so a theme list is matched without sampling.
+    # add() stores new patterns as runs find them; the caller checks them.
+    # record() keeps what became of a pattern ('filled' or 'failed'), and
+    # matching() leaves out the ones that failed
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+        self.sizes = {}  # size -> {slot lengths: [pattern text]}
+        self.holding = {}  # (size, length, count) -> set of slot lengths
+        self.outcomes = {}  # (size, pattern text) -> outcome
+        self.pending = 0
+
+    def connect(self):
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS patterns (size INTEGER, blocks TEXT, '
+                        'lengths TEXT, outcome TEXT, PRIMARY KEY (size, blocks))')
+        # libraries written before outcomes were kept
+        if 'outcome' not in [row[1] for row in self.db.execute('PRAGMA table_info(patterns)')]:
+            self.db.execute('ALTER TABLE patterns ADD COLUMN outcome TEXT')
+        self.db.commit()
+
+    def load(self, size):
+        found = self.sizes.get(size)
+        if found is None:
+            if self.db is None:
+                self.connect()
+            found = self.sizes[size] = {}
+            for text, lengths, outcome in self.db.execute(
+                    'SELECT blocks, lengths, outcome FROM patterns WHERE size = ?', (size,)):
+                self.file(size, text, tuple(int(n) for n in lengths.split(',') if n))
+                if outcome:
+                    self.outcomes[size, text] = outcome
+        return found
+
+    def file(self, size, text, lengths):
+        by_lengths = self.sizes[size]
+        if lengths not in by_lengths:
+            by_lengths[lengths] = []
+            for L, k in Counter(lengths).items():
+                for i in range(1, k + 1):
+                    self.holding.setdefault((size, L, i), set()).add(lengths)
+        by_lengths[lengths].append(text)
+
+    def __len__(self):
+        return sum(len(texts) for by_lengths in self.sizes.values() for texts in by_lengths.values())
+
+    def add(self, blocks):
+        # store blocks unless already known; True if it was new
+        size = len(blocks)
+        text = pattern_text(blocks)
+        lengths = slot_lengths(blocks)
+        if text in self.load(size).get(lengths, ()):
+            return False
+        self.file(size, text, lengths)
+        self.db.execute('INSERT OR IGNORE INTO patterns VALUES (?, ?, ?, NULL)',
+                        (size, text, ','.join(map(str, lengths))))
+        self.wrote()
+        return True
+
+    def record(self, blocks, outcome):
+        # keep what became of blocks, adding it first if it is not known
+        size = len(blocks)
+        text = pattern_text(blocks)
+        self.add(blocks)
+        if self.outcomes.get((size, text)) == outcome:
+            return
+        self.outcomes[size, text] = outcome
+        self.db.execute('UPDATE patterns SET outcome = ? WHERE size = ? AND blocks = ?',
+                        (outcome, size, text))
+        self.wrote()
+
+    def wrote(self):
+        self.pending += 1
+        if self.pending >= 256:
+            self.flush()
+
+    def matching(self, size, lengths):
+        by_lengths = self.load(size)
+        keys = None
+        for L, k in Counter(lengths).items():
+            held = self.holding.get((size, L, k), set())
+            keys = held if keys is None else keys & held
+        if keys is None:
+            keys = by_lengths
+        return [[[ch == '#' for ch in row] for row in text.split('/')]
+                for key in keys for text in by_lengths[key]
+                if self.outcomes.get((size, text)) != 'failed']
+
+    def flush(self):
+        if self.db is not None and self.pending:
+            self.db.commit()
+            self.pending = 0
@@ -0,0 +1,283 @@
+from collections import namedtuple
+
+import fill
+
+# what a worker needs of a slot; the scripts' own Slot classes stay home
+SlotSpec = namedtuple('SlotSpec', 'sid direction cells length')
+
+# settings that only make sense in the calling process: the shared stores
+LOCAL_SETTINGS = ('nogoods', 'cache')
+
+
+def slot_graph(lay, skip):
+    # the crossing graph over the slots not in skip, as {sid: set of sids}
+    adj = {sid: set() for sid in lay.sids if sid not in skip}
+    for sid in adj:
+        for _, other, _ in lay.cross[sid]:
+            if other in adj:
+                adj[sid].add(other)
+    return adj
+
+
+def components(adj, removed=()):
+    seen = set(removed)
+    out = []
+    for sid in adj:
+        if sid in seen:
+            continue
+        seen.add(sid)
+        comp = []
+        stack = [sid]
+        while stack:
+            x = stack.pop()
+            comp.append(x)
+            for y in adj[x]:
+                if y not in seen:
+                    seen.add(y)
+                    stack.append(y)
+        out.append(sorted(comp))
+    return out
+
+
+def cut_slots(adj, removed=()):
+    # articulation points of adj with removed taken out (Tarjan)
+    gone = set(removed)
+    disc = {}
+    low = {}
+    cuts = set()
+
+    def visit(v, parent):
+        disc[v] = low[v] = len(disc)
+        children = 0
+        for u in adj[v]:
+            if u in gone:
+                continue
+            if u not in disc:
+                children += 1
+                visit(u, v)
+                low[v] = min(low[v], low[u])
+                if parent is not None and low[u] >= disc[v]:
+                    cuts.add(v)
+            elif u != parent:
+                low[v] = min(low[v], disc[u])
+        if parent is None and children > 1:
+            cuts.add(v)
+
+    for v in adj:
+        if v not in gone and v not in disc:
+            visit(v, None)
+    return cuts
+
+
+def find_separator(lay, forced, max_size=2, min_region=3, max_share=0.6):
+    # the open slots to fix so the rest fall into two or more regions of at
+    # least min_region slots, none holding more than max_share of the open
+    # slots: () if the forced entries already split them that way, else the
+    # most balanced split by at most max_size slots, or None
+    adj = slot_graph(lay, forced)
+    cap = max_share * len(adj)
+
+    def largest(removed):
+        comps = [c for c in components(adj, removed) if len(c) >= min_region]
+        if len(comps) < 2:
+            return None
+        m = max(len(c) for c in comps)
+        return m if m <= cap else None
+
+    if largest(()) is not None:
+        return ()
+    best = None
+    for v in cut_slots(adj):
+        m = largest((v,))
+        if m is not None and (best is None or m < best[0]):
+            best = (m, (v,))
+    if best is None and max_size >= 2:
+        seen = set()
+        for v in adj:
+            for u in cut_slots(adj, (v,)):
+                pair = tuple(sorted((u, v)))
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                m = largest(pair)
+                if m is not None and (best is None or m < best[0]):
+                    best = (m, pair)
+    return best[1] if best else None
+
+
+def separator_choices(root, seps, width):
+    # word choices for the separator slots: the first 4 * width words of
+    # each AC-3 domain in id order, the width of them leaving the most room
+    # in their crossings kept, then lowest rank sum first
+    lay = root.lay
+    lists = []
+    for sid in seps:
+        ws = root.index[lay.lengths[sid]][0]
+        picks = []
+        for wi in fill.bits(root.domains[sid]):
+            if ws[wi] not in root.used_words:
+                picks.append(ws[wi])
+                if len(picks) == 4 * width:
+                    break
+        root.lcv_sort(sid, picks)
+        lists.append(picks[:width])
+    if len(seps) == 1:
+        for w in lists[0]:
+            yield {seps[0]: w}
+        return
+    a, b = seps
+    cross = [(i, j) for i, other, j in lay.cross[a] if other == b]
+    pairs = sorted(((i + j, i, j) for i in range(len(lists[0])) for j in range(len(lists[1]))))
+    for _, i, j in pairs:
+        wa, wb = lists[0][i], lists[1][j]
+        if wa != wb and all(wa[x] == wb[y] for x, y in cross):
+            yield {a: wa, b: wb}
+
+
+def fill_region(task):
+    # fill one region with its fixed neighbours as forced entries; (the
+    # region's words or None, nodes per run, whether the search ran to its
+    # end rather than out of budget). Runs in a worker or in-process
+    specs, forced, index, kw, exclude = task
+    stats = {}
+    found = fill.solve(specs, forced, index, stats=stats, exclude=exclude, **kw)
+    if found is not None:
+        found = {sid: w for sid, w in found.items() if sid not in forced}
+    return found, stats['runs'], stats['status'] is not None
+
+
+def solve_regions(slots, forced, index, pool=None, separator_tries=8, stats=None, pool_min=16,
+                  **kw):
+    # fill.solve, but filling each region on its own once the forced entries
+    # and at most two separator slots split the grid, on a share of bound;
+    # the whole grid is searched if no separator choice gives a fill
+    lay = fill.Layout(slots)
+    seps = find_separator(lay, forced)
+    if seps is None:
+        return fill.solve(slots, forced, index, stats=stats, **kw)
+    budget = kw.pop('budget', None)
+    penalties = kw.get('penalties')
+    bound = kw.get('bound') if penalties is not None else None
+    remote = {k: v for k, v in kw.items() if k not in LOCAL_SETTINGS}
+    specs = {s.sid: SlotSpec(s.sid, s.direction, tuple(s.cells), s.length) for s in slots}
+    runs = []
+    # region key -> (its words or None, the cap they were sought under), kept
+    # only for searches that ran to their end, so a failure in it is proven
+    memo = {}
+    result = None
+
+    def cost(words):
+        return sum(penalties.of(w) for w in words)
+
+    def known(key, cap):
+        # the remembered outcome if it still holds under cap, else False
+        if key not in memo:
+            return False
+        found, was = memo[key]
+        if found is None:
+            return None if was is None or (cap is not None and cap <= was) else False
+        return found if cap is None or cost(found.values()) < cap else False
+
+    def task(region, fixed, exclude, left, cap, local):
+        near = sorted({o for sid in region for _, o, _ in lay.cross[sid] if o in fixed})
+        settings = dict(kw if local else remote, budget=left)
+        if cap is not None:
+            # the region search counts its forced neighbours' penalty too
+            settings['bound'] = cap + cost(fixed[o] for o in near)
+        return ([specs[x] for x in region + near], {o: fixed[o] for o in near}, index,
+                settings, exclude)
+
+    def remaining():
+        return None if budget is None else max(budget - sum(runs), 1)
+
+    def spent():
+        return budget is not None and sum(runs) >= budget
+
+    root = fill.FillSearch(lay, forced, index, limit=None)
+    if root.status == 'failed':
+        choices = iter(())
+    elif seps:
+        choices = separator_choices(root, seps, 4 * separator_tries)
+    else:
+        choices = iter([{}])
+    tried = 0
+    for choice in choices:
+        if tried == separator_tries or spent():
+            break
+        fixed = dict(forced)
+        fixed.update(choice)
+        search = fill.FillSearch(lay, fixed, index, limit=None) if choice else root
+        if search.status == 'failed':
+            continue
+        tried += 1
+        letters = {}
+        for sid, w in fixed.items():
+            letters.update(zip(specs[sid].cells, w))
+        regions = components(slot_graph(lay, fixed))
+        keys = [tuple((sid, ''.join(letters.get(c, '?') for c in specs[sid].cells))
+                      for sid in region) for region in regions]
+        shares = dict.fromkeys(keys)
+        if bound is not None:
+            # the AC-3 domains of the whole grid under this choice, with no
+            # tiers, so the least of each is a true floor on its cost
+            lows = [sum(penalties.least(lay.lengths[sid], search.domains[sid]) for sid in region)
+                    for region in regions]
+            room = bound - cost(fixed.values()) - sum(lows)
+            if room <= 0:
+                continue
+            total = sum(map(len, regions))
+            for key, region, low in zip(keys, regions, lows):
+                shares[key] = low + room * len(region) / total
+        local = pool is None or not (seps or max(map(len, regions), default=0) >= pool_min)
+
+        if not local:
+            todo = {}
+            for key, region in zip(keys, regions):
+                if key not in todo and known(key, shares[key]) is False:
+                    todo[key] = region
+            if todo:
+                left = remaining()
+                total = sum(map(len, todo.values()))
+                tasks = [task(region, fixed, (), None if left is None else
+                              max(left * len(region) // total, 1), shares[key], False)
+                         for key, region in todo.items()]
+                for key, (found, r, ended) in zip(todo, pool.map(fill_region, tasks)):
+                    if ended:
+                        memo[key] = (found, shares[key])
+                    runs.extend(r)
+
+        # one after another, each region on the room the ones before it left.
+        # Regions are filled blind to each other, so a word may turn up in
+        # two; a later one is then filled again without the words taken
+        out = dict(fixed)
+        for i, (key, region) in enumerate(zip(keys, regions)):
+            cap = None
+            if bound is not None:
+                cap = bound - cost(out.values()) - sum(shares[k] for k in keys[i + 1:])
+            found = known(key, cap)
+            if found is False:
+                found, r, ended = fill_region(task(region, fixed, (), remaining(), cap, True))
+                if ended:
+                    memo[key] = (found, cap)
+                runs.extend(r)
+            taken = set(out.values())
+            if found and taken & set(found.values()):
+                found, r, _ = fill_region(task(region, fixed, taken, remaining(), cap, True))
+                runs.extend(r)
+            if found is None:
+                out = None
+                break
+            out.update(found)
+        if out is not None:
+            result = out
+            break
+    if result is None and root.status != 'failed' and not spent():
+        # the regions gave nothing in the choices tried; fall back on the
+        # whole grid, as a pattern that does not split would be searched
+        whole = {}
+        result = fill.solve(lay, forced, index, stats=whole, budget=remaining(), **kw)
+        runs.extend(whole['runs'])
+    if stats is not None:
+        stats['runs'] = runs
+        stats['separators'] = seps
+    return result
@@ -0,0 +1,215 @@
+from array import array
+
+
+class WordGraph:
+    # a DAWG over one bucket of equal-length words: shared suffixes are
+    # stored once, and the whole graph is four flat arrays. Node 0 is the
+    # end of a word; a node's edges run from start[node] to start[node + 1],
+    # sorted by letter, and paths[node] counts the words below it. ids maps
+    # the alphabetical rank of a word, which the paths give back on the way
+    # down, to its index in the bucket it was built from.
+    #
+    # Patterns are strings of letters and '?' blanks, as elsewhere.
+    #
+    # This is a standalone query engine, for tools that want matches,
+    # counts or possible letters without the positional bitmasks in memory.
+    # FillSearch does not use it: its domains are already masks, so their
+    # bit counts and the index's positional masks answer the same count and
+    # letter questions far faster than a walk of the graph.
+    def __init__(self, ws):
+        self.length = len(ws[0]) if ws else 0
+        self.size = len(ws)
+        order = sorted(range(len(ws)), key=ws.__getitem__)
+        self.ids = array('I', order)
+        words = [ws[i] for i in order]
+
+        L = self.length
+        register = {}
+        nodes = [()]
+
+        def build(lo, hi, d):
+            if d == L:
+                return 0
+            edges = []
+            i = lo
+            while i < hi:
+                ch = words[i][d]
+                j = i + 1
+                while j < hi and words[j][d] == ch:
+                    j += 1
+                edges.append((ord(ch), build(i, j, d + 1)))
+                i = j
+            sig = tuple(edges)
+            node = register.get(sig)
+            if node is None:
+                node = register[sig] = len(nodes)
+                nodes.append(sig)
+            return node
+
+        self.root = build(0, len(words), 0) if words else 0
+        self.start = array('I', [0, 0])
+        self.chars = array('B')
+        self.to = array('I')
+        self.paths = array('I', [1])
+        for sig in nodes[1:]:
+            n = 0
+            for ch, child in sig:
+                self.chars.append(ch)
+                self.to.append(child)
+                n += self.paths[child]
+            self.start.append(len(self.to))
+            self.paths.append(n)
+        if not words:
+            self.paths[0] = 0
+
+    def __len__(self):
+        return self.size
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.ids, self.start, self.chars, self.to, self.paths))
+
+    def edges(self, node, ch):
+        # (letter, child) pairs out of node allowed by pattern letter ch
+        start, chars, to = self.start, self.chars, self.to
+        if ch == '?':
+            return [(chars[e], to[e]) for e in range(start[node], start[node + 1])]
+        c = ord(ch)
+        for e in range(start[node], start[node + 1]):
+            if chars[e] == c:
+                return [(c, to[e])]
+            if chars[e] > c:
+                break
+        return []
+
+    def below(self, pattern):
+        # below(node, d): how many ways node completes pattern from position d
+        L = self.length
+        blank = L
+        while blank > 0 and pattern[blank - 1] == '?':
+            blank -= 1
+        memo = {}
+        paths = self.paths
+
+        def below(node, d):
+            if d >= blank:
+                return paths[node]
+            key = (node, d)
+            n = memo.get(key)
+            if n is None:
+                n = 0
+                for _, child in self.edges(node, pattern[d]):
+                    n += below(child, d + 1)
+                memo[key] = n
+            return n
+        return below
+
+    def count(self, pattern):
+        if len(pattern) != self.length or not self.size:
+            return 0
+        return self.below(pattern)(self.root, 0)
+
+    def letters(self, pattern, i):
+        # {letter: matches with that letter at position i}
+        if len(pattern) != self.length or not self.size:
+            return {}
+        below = self.below(pattern)
+        front = {self.root: 1}
+        for d in range(i):
+            nxt = {}
+            for node, m in front.items():
+                for _, child in self.edges(node, pattern[d]):
+                    nxt[child] = nxt.get(child, 0) + m
+            front = nxt
+        out = {}
+        for node, m in front.items():
+            for c, child in self.edges(node, pattern[i]):
+                n = below(child, i + 1)
+                if n:
+                    ch = chr(c)
+                    out[ch] = out.get(ch, 0) + m * n
+        return out
+
+    def ranks(self, pattern):
+        # alphabetical ranks of the matching words, in order
+        if len(pattern) != self.length or not self.size:
+            return
+        below = self.below(pattern)
+        if not below(self.root, 0):
+            return
+        paths, start, to = self.paths, self.start, self.to
+        L = self.length
+        stack = [(self.root, 0, 0)]
+        while stack:
+            node, d, rank = stack.pop()
+            if d == L:
+                yield rank
+                continue
+            if pattern[d:] == '?' * (L - d):
+                yield from range(rank, rank + paths[node])
+                continue
+            # edges before the allowed ones still shift the rank
+            found = []
+            for e in range(start[node], start[node + 1]):
+                child = to[e]
+                if pattern[d] == '?' or self.chars[e] == ord(pattern[d]):
+                    if below(child, d + 1):
+                        found.append((child, d + 1, rank))
+                rank += paths[child]
+            stack.extend(reversed(found))
+
+    def words(self, pattern):
+        # the matching words themselves, rebuilt from the edges
+        if len(pattern) != self.length or not self.size:
+            return
+        below = self.below(pattern)
+        stack = [(self.root, 0, '')]
+        while stack:
+            node, d, prefix = stack.pop()
+            if d == self.length:
+                yield prefix
+                continue
+            found = [(child, d + 1, prefix + chr(c)) for c, child in self.edges(node, pattern[d])
+                     if below(child, d + 1)]
+            stack.extend(reversed(found))
+
+    def mask(self, pattern):
+        # bitmask over bucket indexes, as fill.pattern_mask gives
+        if pattern == '?' * self.length:
+            return (1 << self.size) - 1
+        ids = self.ids
+        mask = 0
+        for r in self.ranks(pattern):
+            mask |= 1 << ids[r]
+        return mask
+
+
+class WordGraphs:
+    # a WordGraph per length of a fill index, each built the first time a
+    # query needs it. get(L, pattern) returns the same mask as
+    # fill.pattern_mask, for checking one against the other; building it
+    # walks every match, so it is no substitute for a fill.PatternCache
+    def __init__(self, index):
+        self.index = index
+        self.graphs = {}
+
+    def graph(self, L):
+        g = self.graphs.get(L)
+        if g is None:
+            ws = self.index[L][0] if L in self.index else []
+            g = self.graphs[L] = WordGraph(ws)
+        return g
+
+    def get(self, L, pattern):
+        return self.graph(L).mask(pattern)
+
+    def count(self, L, pattern):
+        return self.graph(L).count(pattern)
+
+    def letters(self, L, pattern, i):
+        return self.graph(L).letters(pattern, i)
+
+    def words(self, L, pattern):
+        return list(self.graph(L).words(pattern))
+
+    def nbytes(self):
+        return sum(g.nbytes() for g in self.graphs.values())
@@ -0,0 +1,463 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+from array import array
+from collections import defaultdict
+
+import fill
+
+DICT_PATH = '/usr/share/dict/words'
+CACHE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MAGIC = b'XWRD'
+VERSION = 4
+
+# relative frequency of letters in English text, in percent
+LETTER_FREQ = {
+    'E': 12.7, 'T': 9.1, 'A': 8.2, 'O': 7.5, 'I': 7.0, 'N': 6.7, 'S': 6.3, 'H': 6.1,
+    'R': 6.0, 'D': 4.3, 'L': 4.0, 'C': 2.8, 'U': 2.8, 'M': 2.4, 'W': 2.4, 'F': 2.2,
+    'G': 2.0, 'Y': 2.0, 'P': 1.9, 'B': 1.5, 'V': 1.0, 'K': 0.8, 'J': 0.15, 'X': 0.15,
+    'Q': 0.10, 'Z': 0.07,
+}
+LOG_FREQ = {ch: math.log(f) for ch, f in LETTER_FREQ.items()}
+
+
+def word_quality(w):
+    # higher is better: the mean log frequency of its letters, so words made
+    # of common letters rank above ones leaning on rare letters
+    return sum(LOG_FREQ[ch] for ch in w) / len(w)
+
+
+def word_penalty(w):
+    # the per-entry terms of generate_puzzle.score_entries: a letter three
+    # times running, each of JQXZ, and words of one or two distinct letters
+    penalty = 0
+    if any(ch * 3 in w for ch in set(w)):
+        penalty += 3
+    penalty += sum(w.count(ch) for ch in 'QXZJ') * 0.5
+    if len(set(w)) <= 2:
+        penalty += 5
+    return penalty
+
+
+# names word_penalty in the penalty group files LazyIndex keeps; change it
+# whenever word_penalty, or anything it reads, changes
+PENALTY_KEY = 'word_penalty-1'
+
+
+def score_words(ws):
+    # one score per word, lower is better: word_penalty plus a soft term
+    # under 0.5 for vowel balance, repeated letters and the letter-frequency
+    # rank within ws. Penalties come in steps of 0.5, so ordering by score
+    # orders by penalty first
+    by_quality = sorted(range(len(ws)), key=lambda i: -word_quality(ws[i]))
+    rank = [0] * len(ws)
+    for r, i in enumerate(by_quality):
+        rank[i] = r / len(ws)
+    scores = array('f')
+    for w, r in zip(ws, rank):
+        L = len(w)
+        vowels = sum(ch in 'AEIOU' for ch in w)
+        balance = min(1.0, abs(vowels / L - 0.4) / 0.4)
+        repeats = (L - len(set(w))) / L
+        scores.append(word_penalty(w) + 0.49 * (balance + repeats + r) / 3)
+    return scores
+
+
+def filter_words(path, max_len, extra=(), max_weird=None, lengths=None):
+    # lowercase alphabetic dictionary words of 3..max_len letters with a
+    # vowel, not made of just one or two letters, with at most max_weird of
+    # JQXZ, as {length: (words, scores)}. Every bucket comes out best
+    # score_words first, so the first n ids of a length are always its top-n
+    # tier and an id-ordered walk is a ranked one. lengths, if given, limits
+    # the result to those buckets
+    by_len = defaultdict(set)
+    with open(path, errors='ignore') as f:
+        for raw in f:
+            w = raw.strip()
+            L = len(w)
+            if lengths is not None and L not in lengths:
+                continue
+            if not w.isalpha() or w.lower() != w:
+                continue
+            w = w.upper()
+            if L < 3 or L > max_len:
+                continue
+            if sum(ch in 'AEIOUY' for ch in w) == 0:
+                continue
+            if len(set(w)) <= 2 and L > 4:
+                continue
+            if max_weird is not None and sum(ch in 'JQXZ' for ch in w) > max_weird:
+                continue
+            by_len[L].add(w)
+    for w in extra:
+        if lengths is None or len(w) in lengths:
+            by_len[len(w)].add(w)
+    out = {}
+    for L, ws in by_len.items():
+        ws = sorted(ws)
+        scores = score_words(ws)
+        order = sorted(range(len(ws)), key=lambda i: (scores[i], ws[i]))
+        out[L] = ([ws[i] for i in order], array('f', (scores[i] for i in order)))
+    return out
+
+
+def cache_key(path, max_len, extra, max_weird):
+    st = os.stat(path)
+    return {'version': VERSION, 'source': os.path.abspath(path), 'size': st.st_size,
+            'mtime': st.st_mtime_ns, 'max_len': max_len, 'extra': sorted(extra),
+            'max_weird': max_weird}
+
+
+def cache_path(key, L, cache_dir, ext='bin'):
+    params = {k: v for k, v in key.items() if k not in ('size', 'mtime')}
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, '.wordcache-%s-%d.%s' % (digest, L, ext))
+
+
+def compile_words(target, key, ws, pos, scores):
+    # layout: MAGIC, header length, JSON header, the words as fixed-width
+    # letters, their scores as float32, then every (position, letter)
+    # bitmask as little-endian bytes; the header records the mask offsets,
+    # and how many words have each letter at each position
+    data = ''.join(ws).encode()
+    nbytes = (len(ws) + 7) // 8
+    header = {'key': key, 'count': len(ws), 'masks': [],
+              'counts': [{ch: m.bit_count() for ch, m in sorted(masks.items())} for masks in pos]}
+    chunks = [data, scores.tobytes()]
+    offset = len(data) + 4 * len(ws)
+    for masks in pos:
+        at = []
+        for ch in sorted(masks):
+            chunks.append(masks[ch].to_bytes(nbytes, 'little'))
+            at.append((ch, offset))
+            offset += nbytes
+        header['masks'].append(at)
+    head = json.dumps(header).encode()
+    tmp = '%s.%d.tmp' % (target, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(head)) + head)
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp, target)
+
+
+def read_header(target, key):
+    # the JSON header of a compiled file, read without the rest of it, or
+    # None as read_compiled would give
+    try:
+        with open(target, 'rb') as f:
+            head = f.read(8)
+            if len(head) < 8 or head[:4] != MAGIC:
+                return None
+            (hlen,) = struct.unpack('<I', head[4:8])
+            header = json.loads(f.read(hlen))
+    except (OSError, ValueError):
+        return None
+    return header if header.get('key') == key else None
+
+
+def read_compiled(target, key, L, mapped=False):
+    # (words, positional masks, scores) from a compiled file, or None if it
+    # is missing, damaged or was built from another source or other filters.
+    # mapped keeps the file mapped and returns views into it instead of
+    # copies, so processes reading the same file share one set of pages
+    try:
+        f = open(target, 'rb')
+    except OSError:
+        return None
+    with f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+    try:
+        if mm[:4] != MAGIC:
+            raise ValueError(target)
+        (hlen,) = struct.unpack('<I', mm[4:8])
+        header = json.loads(mm[8:8 + hlen])
+        if header['key'] != key:
+            raise ValueError(target)
+        base = 8 + hlen
+        n = header['count']
+        nbytes = (n + 7) // 8
+        # a file cut short would otherwise read as masks with no words in them
+        if len(mm) < base + n * L + 4 * n + sum(map(len, header['masks'])) * nbytes:
+            raise ValueError(target)
+    except (ValueError, KeyError, TypeError, struct.error):
+        mm.close()
+        return None
+    if mapped:
+        ws = MappedWords(mm, base, n, L)
+        scores = memoryview(mm)[base + n * L:base + n * L + 4 * n].cast('f')
+        pos = [MappedMasks(mm, {ch: base + off for ch, off in at}, nbytes)
+               for at in header['masks']]
+        return ws, pos, scores
+    with mm:
+        text = mm[base:base + n * L].decode()
+        ws = [text[i:i + L] for i in range(0, n * L, L)]
+        scores = array('f')
+        scores.frombytes(mm[base + n * L:base + n * L + 4 * n])
+        pos = []
+        for at in header['masks']:
+            pos.append({ch: int.from_bytes(mm[base + off:base + off + nbytes], 'little')
+                        for ch, off in at})
+    return ws, pos, scores
+
+
+def compile_groups(target, key, groups, nbytes):
+    # layout: MAGIC, header length, JSON header with the group penalties,
+    # then each group's mask as little-endian bytes
+    head = json.dumps({'key': key, 'penalties': [p for p, _ in groups]}).encode()
+    tmp = '%s.%d.tmp' % (target, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(head)) + head)
+        for _, mask in groups:
+            f.write(mask.to_bytes(nbytes, 'little'))
+    os.replace(tmp, target)
+
+
+def read_groups(target, key, nbytes):
+    # the (penalty, mask) groups of a compile_groups file, or None if it is
+    # missing, damaged or was built from other words or another penalty
+    try:
+        with open(target, 'rb') as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            return None
+        (hlen,) = struct.unpack('<I', data[4:8])
+        header = json.loads(data[8:8 + hlen])
+        if header['key'] != key:
+            return None
+        penalties = header['penalties']
+        base = 8 + hlen
+        if len(data) < base + len(penalties) * nbytes:
+            return None
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return None
+    return [(p, int.from_bytes(data[base + i * nbytes:base + (i + 1) * nbytes], 'little'))
+            for i, p in enumerate(penalties)]
+
+
+class MappedWords:
+    # the fixed-width letter matrix of a mapped compiled file as a read-only
+    # word sequence; words are decoded as they are asked for
+    def __init__(self, mm, base, n, L):
+        self.mm = mm
+        self.base = base
+        self.n = n
+        self.L = L
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(self.n))]
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        at = self.base + i * self.L
+        return self.mm[at:at + self.L].decode()
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield self[i]
+
+
+class MappedMasks:
+    # one position's {letter: mask} from a mapped compiled file; each mask
+    # becomes an int the first time it is used, and only then
+    def __init__(self, mm, offsets, nbytes):
+        self.mm = mm
+        self.offsets = offsets
+        self.nbytes = nbytes
+        self.masks = {}
+
+    def __contains__(self, ch):
+        return ch in self.offsets
+
+    def __getitem__(self, ch):
+        mask = self.masks.get(ch)
+        if mask is None:
+            off = self.offsets[ch]
+            mask = self.masks[ch] = int.from_bytes(self.mm[off:off + self.nbytes], 'little')
+        return mask
+
+    def get(self, ch, default=None):
+        return self[ch] if ch in self.offsets else default
+
+    def keys(self):
+        return self.offsets.keys()
+
+    def items(self):
+        return [(ch, self[ch]) for ch in self.offsets]
+
+
+class LazyIndex:
+    # {length: (words, positional masks)} like fill.build_indexes returns,
+    # but each length is only read, from its compiled cache file while the
+    # source and filters are unchanged or else filtered and compiled afresh,
+    # the first time something asks for it. scores(L) gives the matching
+    # score_words array.
+    #
+    # mapped serves each length straight from its mapped cache file (see
+    # read_compiled), for worker processes: pickling the index sends only its
+    # settings, and each worker maps the same files, so the word matrices
+    # are shared rather than copied per process
+    def __init__(self, max_len, extra=(), max_weird=None, path=DICT_PATH, cache_dir=CACHE_DIR,
+                 mapped=False):
+        self.max_len = max_len
+        self.extra = list(extra)
+        self.max_weird = max_weird
+        self.path = path
+        self.cache_dir = cache_dir
+        self.mapped = mapped
+        self.key = None
+        self.lengths = {}
+        self.score_tables = {}
+        self.words = LazyWords(self)
+
+    def __getstate__(self):
+        # a copy sent to a worker always maps, whatever this one does
+        state = dict(self.__dict__, lengths={}, score_tables={}, mapped=True)
+        del state['words']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.words = LazyWords(self)
+
+    def prepare(self, lengths):
+        # compile the cache files of these lengths now, without loading them
+        # here, so that workers started later only ever map them; the ones
+        # missing or stale all come from one pass over the dictionary
+        missing = {}
+        for L in lengths:
+            if 3 <= L <= self.max_len:
+                key = dict(self.cache_key(), length=L)
+                target = cache_path(key, L, self.cache_dir)
+                if read_header(target, key) is None:
+                    missing[L] = (key, target)
+        if missing:
+            found = filter_words(self.path, self.max_len, self.extra, self.max_weird,
+                                 lengths=set(missing))
+            for L, (key, target) in missing.items():
+                self.build(L, key, target, found.get(L, ([], array('f'))))
+
+    def header(self, L):
+        # the header of length L's compiled file, compiled first if missing
+        # or stale; None if it cannot be written
+        key = dict(self.cache_key(), length=L)
+        target = cache_path(key, L, self.cache_dir)
+        header = read_header(target, key)
+        if header is None and self.build(L, key, target)[3]:
+            header = read_header(target, key)
+        return header
+
+    def letter_counts(self, L):
+        # (words of length L, [{letter: words with it there} per position]),
+        # from the compiled header, so no words are read into memory
+        if not 3 <= L <= self.max_len:
+            return 0, []
+        header = self.header(L)
+        if header is not None:
+            return header['count'], header['counts']
+        ws, pos = self.load(L)
+        return len(ws), [{ch: m.bit_count() for ch, m in masks.items()} for masks in pos]
+
+    def penalty_groups(self, L, penalty, name):
+        # fill.PenaltyTable's groups for length L, kept in a file beside the
+        # compiled words and keyed on them and on name, which the caller
+        # changes along with penalty, so later runs and worker processes
+        # read them instead of scoring every word
+        ws = self.load(L)[0]
+        key = dict(self.cache_key(), length=L, penalty=name)
+        target = cache_path(key, L, self.cache_dir, 'pen')
+        nbytes = (len(ws) + 7) // 8
+        groups = read_groups(target, key, nbytes)
+        if groups is None:
+            groups = fill.penalty_groups(ws, penalty)
+            try:
+                compile_groups(target, key, groups, nbytes)
+            except OSError:
+                pass
+        return groups
+
+    def cache_key(self):
+        if self.key is None:
+            self.key = cache_key(self.path, self.max_len, self.extra, self.max_weird)
+        return self.key
+
+    def load(self, L):
+        if L not in self.lengths:
+            if not 3 <= L <= self.max_len:
+                ws, pos, scores = [], [], array('f')
+            else:
+                ws, pos, scores = self.read(L)
+            self.lengths[L] = (ws, pos)
+            self.score_tables[L] = scores
+        return self.lengths[L]
+
+    def scores(self, L):
+        self.load(L)
+        return self.score_tables[L]
+
+    def read(self, L):
+        key = dict(self.cache_key(), length=L)
+        target = cache_path(key, L, self.cache_dir)
+        loaded = read_compiled(target, key, L, self.mapped)
+        if loaded is not None:
+            return loaded
+        ws, pos, scores, written = self.build(L, key, target)
+        if written and self.mapped:
+            return read_compiled(target, key, L, True) or (ws, pos, scores)
+        return ws, pos, scores
+
+    def build(self, L, key, target, found=None):
+        # filter and compile length L afresh, or compile found, its (words,
+        # scores) from filter_words: (words, masks, scores, whether the file
+        # was written)
+        if found is None:
+            found = filter_words(self.path, self.max_len, self.extra, self.max_weird,
+                                 lengths={L}).get(L, ([], array('f')))
+        ws, scores = found
+        pos = fill.build_indexes({L: ws})[L][1]
+        try:
+            compile_words(target, key, ws, pos, scores)
+        except OSError:
+            return ws, pos, scores, False
+        return ws, pos, scores, True
+
+    def __contains__(self, L):
+        return bool(self.load(L)[0])
+
+    def __getitem__(self, L):
+        entry = self.load(L)
+        if not entry[0]:
+            raise KeyError(L)
+        return entry
+
+    def get(self, L, default=None):
+        entry = self.load(L)
+        return entry if entry[0] else default
+
+
+class LazyWords:
+    # {length: words} view of a LazyIndex
+    def __init__(self, index):
+        self.index = index
+
+    def __contains__(self, L):
+        return L in self.index
+
+    def __getitem__(self, L):
+        return self.index[L][0]
+
+    def get(self, L, default=None):
+        entry = self.index.get(L)
+        return entry[0] if entry else default